@@ -3,11 +3,14 @@ from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.contrib.admin import SimpleListFilter
+from django.db import connection
 from django.db.models import Count, Q
 from django.utils.translation import gettext_lazy as _
 from django.contrib.admin import AdminSite
 from backend.models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, \
-    Contact, ConfirmEmailToken
+    Contact, ConfirmEmailToken, ImportJob
+from backend.catalog import update_catalog_shop_state
+from backend.search import search_query
 
 
 def is_shop_user(request):
@@ -286,8 +289,8 @@ class ShopAdmin(ReadOnlyAdmin):
     """
     Панель управления магазинами
     """
-    list_display = ('name', 'user_email', 'url', 'state')
-    list_filter = ('state',)
+    list_display = ('name', 'user_email', 'url', 'state', 'import_method')
+    list_filter = ('state', 'import_method')
     search_fields = ('name', 'user__email', 'url')
     
     
@@ -295,6 +298,12 @@ class ShopAdmin(ReadOnlyAdmin):
         return obj.user.email if obj.user else '-'
     user_email.short_description = 'Пользователь'
 
+    def save_model(self, request, obj, form, change):
+        """Прием заказов, измененный в админке, сразу отражается в каталоге для выдачи"""
+        super().save_model(request, obj, form, change)
+        if change and 'state' in form.changed_data:
+            update_catalog_shop_state(Shop.objects.filter(id=obj.id))
+
 
 class CategoryAdmin(ReadOnlyAdmin):
     """
@@ -337,6 +346,13 @@ class ProductInfoAdmin(ReadOnlyAdmin):
     search_fields = ('product__name', 'model')
 
     inlines = [ProductParameterInline]  
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по полнотекстовому индексу вместо ILIKE по названию и модели"""
+        if not search_term or connection.vendor != 'postgresql':
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(search_vector=search_query(search_term)), False
+
     def get_product_name(self, obj):
         return obj.product.name
     get_product_name.short_description = 'Товар'
@@ -375,6 +391,29 @@ class ProductParameterAdmin(ReadOnlyAdmin):
     get_shop.short_description = 'Магазин'
 
 
+class ImportJobAdmin(ReadOnlyAdmin):
+    """
+    История импорта прайс-листов: длительность, запросы, строки и память по этапам
+    """
+    list_display = ('id', 'shop', 'source', 'mode', 'state', 'processed', 'duration', 'queries',
+                    'rows_inserted', 'rows_updated', 'rows_deleted', 'peak_memory_display', 'created_at')
+    list_filter = ('state', 'source', 'mode', ShopFilter)
+    search_fields = ('url', 'shop__name', 'user__email')
+    date_hierarchy = 'created_at'
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request).select_related('shop')
+        if is_superuser(request):
+            return queryset
+        if is_shop_user(request):
+            return queryset.filter(user=request.user)
+        return queryset.none()
+
+    def peak_memory_display(self, obj):
+        return f'{obj.peak_memory / 2 ** 20:.1f} МБ' if obj.peak_memory is not None else '-'
+    peak_memory_display.short_description = 'Пик памяти'
+
+
 class OrderAdmin(admin.ModelAdmin):
     """
     Панель управления заказами
@@ -942,8 +981,9 @@ class MyAdminSite(AdminSite):
                     # ПОКУПАТЕЛИ видят ВСЕ модели (Shop, Category, Product, ProductInfo, 
                     # Parameter, ProductParameter, Order, OrderItem, Contact)
                     if request.user.type == 'buyer':
-                        # Покупатели видят все модели backend
-                        app_copy['models'].append(model)
+                        # Покупатели видят все модели backend, кроме истории импорта магазинов
+                        if model_name != 'ImportJob':
+                            app_copy['models'].append(model)
                     
                     # МАГАЗИНЫ видят все модели кроме User и Contact
                     elif is_shop_user(request):
@@ -972,6 +1012,7 @@ admin_site.register(Order, OrderAdmin)
 admin_site.register(OrderItem, OrderItemAdmin)
 admin_site.register(Contact, ContactAdmin)
 admin_site.register(ConfirmEmailToken, ConfirmEmailTokenAdmin)
+admin_site.register(ImportJob, ImportJobAdmin)
 
 # Заменяем стандартный admin.site на кастомный
 admin.site = admin_site
\ No newline at end of file
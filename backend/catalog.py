@@ -0,0 +1,99 @@
+import json
+
+from django.db import connection
+from django.db.models import Prefetch
+
+from backend.models import CatalogEntry, ProductInfo, ProductParameter
+
+
+# Предложений в одной пачке пересборки каталога
+CATALOG_CHUNK_SIZE = 2000
+
+# Поля записи каталога, перезаписываемые при пересборке
+CATALOG_ENTRY_FIELDS = ('shop', 'category', 'price', 'in_stock', 'shop_state', 'document')
+
+# Запись пачки каталога: неизменившиеся записи не перезаписываются и не оставляют мертвых версий строк
+UPSERT_CATALOG_SQL = """
+    INSERT INTO {table} AS entry (product_info_id, shop_id, category_id, price, in_stock, shop_state, document)
+    VALUES {values}
+    ON CONFLICT (product_info_id) DO UPDATE
+    SET shop_id = EXCLUDED.shop_id, category_id = EXCLUDED.category_id, price = EXCLUDED.price,
+        in_stock = EXCLUDED.in_stock, shop_state = EXCLUDED.shop_state, document = EXCLUDED.document
+    WHERE (entry.shop_id, entry.category_id, entry.price, entry.in_stock, entry.shop_state, entry.document)
+          IS DISTINCT FROM
+          (EXCLUDED.shop_id, EXCLUDED.category_id, EXCLUDED.price, EXCLUDED.in_stock, EXCLUDED.shop_state,
+           EXCLUDED.document)
+"""
+
+
+def catalog_document(offer):
+    """
+    Предложение в том виде, в котором его отдает GET products (поля ProductInfoSerializer)
+    """
+    return {
+        'id': offer.id,
+        'model': offer.model,
+        'product': {'name': offer.product.name, 'category': offer.product.category.name},
+        'shop': offer.shop_id,
+        'quantity': offer.quantity,
+        'price': f'{offer.price:.2f}',
+        'price_rrc': f'{offer.price_rrc:.2f}',
+        'product_parameters': [{'parameter': parameter.parameter.name, 'value': parameter.value}
+                               for parameter in offer.product_parameters.all()],
+    }
+
+
+def refresh_catalog_entries(product_info_ids):
+    """
+    Пересборка записей каталога для предложений по ИД пачками INSERT ... ON CONFLICT.
+    Записи удаленных предложений удаляются каскадно вместе с ними. Возвращает число записанных записей
+    """
+    product_info_ids = sorted(set(product_info_ids))
+    written = 0
+    for start in range(0, len(product_info_ids), CATALOG_CHUNK_SIZE):
+        offers = ProductInfo.objects.filter(
+            id__in=product_info_ids[start:start + CATALOG_CHUNK_SIZE]
+        ).select_related('product__category', 'shop').prefetch_related(
+            Prefetch('product_parameters', queryset=ProductParameter.objects.select_related('parameter').order_by('id'))
+        ).defer('search_vector').order_by('id')
+        written += write_catalog_entries([
+            CatalogEntry(product_info_id=offer.id, shop_id=offer.shop_id, category_id=offer.product.category_id,
+                         price=offer.price, in_stock=offer.quantity > 0, shop_state=offer.shop.state,
+                         document=catalog_document(offer))
+            for offer in offers
+        ])
+    return written
+
+
+def write_catalog_entries(entries):
+    """
+    Запись пачки каталога: в PostgreSQL только изменившихся записей, в остальных БД через bulk_create
+    """
+    if not entries:
+        return 0
+    if connection.vendor != 'postgresql':
+        CatalogEntry.objects.bulk_create(entries, update_conflicts=True, unique_fields=['product_info'],
+                                         update_fields=CATALOG_ENTRY_FIELDS)
+        return len(entries)
+
+    sql = UPSERT_CATALOG_SQL.format(
+        table=connection.ops.quote_name(CatalogEntry._meta.db_table),
+        values=', '.join(['(%s, %s, %s, %s, %s, %s, %s::jsonb)'] * len(entries)),
+    )
+    params = []
+    for entry in entries:
+        params += [entry.product_info_id, entry.shop_id, entry.category_id, entry.price, entry.in_stock,
+                   entry.shop_state, json.dumps(entry.document, ensure_ascii=False)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def update_catalog_shop_state(shops):
+    """
+    Перенос признака приема заказов магазинов (выборка Shop) в записи каталога одним UPDATE на магазин
+    """
+    updated = 0
+    for shop_id, state in shops.values_list('id', 'state'):
+        updated += CatalogEntry.objects.filter(shop_id=shop_id).exclude(shop_state=state).update(shop_state=state)
+    return updated
@@ -0,0 +1,281 @@
+import io
+
+from django.db import connection
+
+from backend.importer import CatalogImporter, MODE_DIFF, MODE_REPLACE
+from backend.models import Product, ProductInfo, Parameter, ProductParameter
+from backend.upserts import insert_missing
+
+
+# Товаров в одном COPY
+COPY_BATCH_SIZE = 10000
+
+# Промежуточные таблицы живут до конца транзакции импорта
+STAGING_SQL = (
+    """
+    CREATE TEMPORARY TABLE import_goods (
+        position integer NOT NULL,
+        external_id integer NOT NULL,
+        category_id integer NOT NULL,
+        name varchar(80) NOT NULL,
+        model varchar(80) NOT NULL,
+        price numeric(10, 2) NOT NULL,
+        price_rrc numeric(10, 2) NOT NULL,
+        quantity integer NOT NULL,
+        product_id integer,
+        product_info_id integer
+    ) ON COMMIT DROP
+    """,
+    """
+    CREATE TEMPORARY TABLE import_parameters (
+        position integer NOT NULL,
+        name varchar(40) NOT NULL,
+        value varchar(100) NOT NULL,
+        parameter_id integer
+    ) ON COMMIT DROP
+    """,
+)
+
+GOODS_COLUMNS = ('position', 'external_id', 'category_id', 'name', 'model', 'price', 'price_rrc', 'quantity')
+PARAMETER_COLUMNS = ('position', 'name', 'value')
+
+# Индексы и статистика после заполнения: автоочистка временные таблицы не анализирует
+STAGING_INDEX_SQL = (
+    'CREATE INDEX ON import_goods (position)',
+    'CREATE INDEX ON import_goods (external_id)',
+    'CREATE INDEX ON import_parameters (position)',
+    'ANALYZE import_goods',
+    'ANALYZE import_parameters',
+)
+
+# В режиме diff при повторе external_id в прайсе берется первый товар
+DEDUPLICATE_SQL = """
+    DELETE FROM import_goods AS goods USING import_goods AS first
+    WHERE first.external_id = goods.external_id AND first.position < goods.position
+"""
+
+# Ключи справочников из прайса, которых еще нет в каталоге: они вставляются через insert_missing
+MISSING_PRODUCTS_SQL = """
+    SELECT DISTINCT name, category_id FROM import_goods AS goods
+    WHERE NOT EXISTS (SELECT 1 FROM {product} AS product
+                      WHERE product.name = goods.name AND product.category_id = goods.category_id)
+"""
+
+RESOLVE_PRODUCTS_SQL = """
+    UPDATE import_goods AS goods SET product_id = product.id
+    FROM {product} AS product
+    WHERE product.name = goods.name AND product.category_id = goods.category_id
+"""
+
+MISSING_PARAMETERS_SQL = """
+    SELECT DISTINCT name FROM import_parameters AS parameters
+    WHERE NOT EXISTS (SELECT 1 FROM {parameter} AS parameter WHERE parameter.name = parameters.name)
+"""
+
+RESOLVE_PARAMETERS_SQL = """
+    UPDATE import_parameters AS parameters SET parameter_id = parameter.id
+    FROM {parameter} AS parameter
+    WHERE parameter.name = parameters.name
+"""
+
+# Текущее предложение с тем же external_id, при дублях - с меньшим ИД
+MATCH_OFFERS_SQL = """
+    UPDATE import_goods AS goods SET product_info_id = offer.id
+    FROM (
+        SELECT external_id, MIN(id) AS id FROM {product_info} WHERE shop_id = %s GROUP BY external_id
+    ) AS offer
+    WHERE offer.external_id = goods.external_id
+"""
+
+UPDATE_OFFERS_SQL = """
+    UPDATE {product_info} AS offer
+    SET product_id = goods.product_id, model = goods.model, price = goods.price,
+        price_rrc = goods.price_rrc, quantity = goods.quantity
+    FROM import_goods AS goods
+    WHERE offer.id = goods.product_info_id
+      AND (offer.product_id, offer.model, offer.price, offer.price_rrc, offer.quantity) IS DISTINCT FROM
+          (goods.product_id, goods.model, goods.price, goods.price_rrc, goods.quantity)
+    RETURNING offer.id, 1
+"""
+
+INSERT_OFFERS_SQL = """
+    INSERT INTO {product_info} (shop_id, external_id, product_id, model, price, price_rrc, quantity)
+    SELECT %s, external_id, product_id, model, price, price_rrc, quantity FROM import_goods
+    WHERE product_info_id IS NULL
+    ORDER BY position
+    RETURNING id, 1
+"""
+
+RESOLVE_NEW_OFFERS_SQL = """
+    UPDATE import_goods AS goods SET product_info_id = offer.id
+    FROM {product_info} AS offer
+    WHERE goods.product_info_id IS NULL
+      AND offer.shop_id = %s AND offer.external_id = goods.external_id AND offer.product_id = goods.product_id
+"""
+
+# Параметры предложений из прайса, которых нет в новом наборе или значение которых изменилось.
+# Запросы параметров возвращают ИД затронутых предложений и число строк по каждому
+DELETE_PRODUCT_PARAMETERS_SQL = """
+    WITH deleted AS (
+        DELETE FROM {product_parameter} AS product_parameter USING import_goods AS goods
+        WHERE product_parameter.product_info_id = goods.product_info_id
+          AND NOT EXISTS (
+              SELECT 1 FROM import_parameters AS parameters
+              WHERE parameters.position = goods.position
+                AND parameters.parameter_id = product_parameter.parameter_id
+                AND parameters.value = product_parameter.value)
+        RETURNING product_parameter.product_info_id
+    )
+    SELECT product_info_id, COUNT(*) FROM deleted GROUP BY product_info_id
+"""
+
+INSERT_PRODUCT_PARAMETERS_SQL = """
+    WITH inserted AS (
+        INSERT INTO {product_parameter} (product_info_id, parameter_id, value)
+        SELECT goods.product_info_id, parameters.parameter_id, parameters.value
+        FROM import_parameters AS parameters JOIN import_goods AS goods ON goods.position = parameters.position
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {product_parameter} AS product_parameter
+            WHERE product_parameter.product_info_id = goods.product_info_id
+              AND product_parameter.parameter_id = parameters.parameter_id)
+        RETURNING product_info_id
+    )
+    SELECT product_info_id, COUNT(*) FROM inserted GROUP BY product_info_id
+"""
+
+MISSING_OFFERS_SQL = """
+    SELECT offer.id FROM {product_info} AS offer
+    WHERE offer.shop_id = %s
+      AND NOT EXISTS (SELECT 1 FROM import_goods AS goods WHERE goods.product_info_id = offer.id)
+"""
+
+
+def copy_value(value):
+    """
+    Значение поля в текстовом формате COPY
+    """
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class CopyCatalogImporter(CatalogImporter):
+    """
+    Импорт прайс-листа через промежуточные таблицы PostgreSQL.
+    Товары пачками загружаются во временные таблицы командой COPY, затем каталог сливается
+    несколькими запросами на весь прайс: продукты, параметры, предложения и их параметры.
+
+    Результат тот же, что у CatalogImporter, но число запросов не зависит от размера прайса.
+    Прогресс отражает загрузку в промежуточные таблицы, слияние идет после нее
+    """
+
+    def __init__(self, user_id, batch_size=COPY_BATCH_SIZE, mode=MODE_DIFF, progress=None, job=None):
+        super().__init__(user_id, batch_size=batch_size, mode=mode, progress=progress, job=job)
+        self._position = 0
+        # Имена таблиц каталога для подстановки в запросы слияния
+        self._tables = {
+            key: connection.ops.quote_name(model._meta.db_table)
+            for key, model in (('product', Product), ('product_info', ProductInfo),
+                               ('parameter', Parameter), ('product_parameter', ProductParameter))
+        }
+
+    def execute(self, sql, params=None):
+        """
+        Выполнение запроса слияния. Возвращает число затронутых строк
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql.format(**self._tables), params)
+            return cursor.rowcount
+
+    def fetch(self, sql, params=None):
+        """
+        Строки результата запроса к промежуточным таблицам
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql.format(**self._tables), params)
+            return cursor.fetchall()
+
+    def execute_touching(self, sql, params=None):
+        """
+        Выполнение запроса, возвращающего пары (ИД предложения, число строк): предложения запоминаются
+        для пересборки поиска и каталога для выдачи. Возвращает число затронутых строк
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql.format(**self._tables), params)
+            rows = cursor.fetchall()
+        self._touched.update(product_info_id for product_info_id, _ in rows)
+        return sum(count for _, count in rows)
+
+    def prepare(self, shop):
+        with self.phase('staging'):
+            for sql in STAGING_SQL:
+                self.execute(sql)
+        if self.mode == MODE_REPLACE:
+            self.delete_offers(shop)
+
+    def import_goods(self, shop, items):
+        """
+        Загрузка пачки товаров и их параметров в промежуточные таблицы
+        """
+        goods = io.StringIO()
+        parameters = io.StringIO()
+        for item in items:
+            self._position += 1
+            row = (self._position, int(item['id']), int(item['category']), item['name'], item['model'],
+                   self.to_price(item['price']), self.to_price(item['price_rrc']), int(item['quantity']))
+            goods.write('\t'.join(map(copy_value, row)) + '\n')
+            for name, value in self.item_parameters(item).items():
+                parameters.write('\t'.join(map(copy_value, (self._position, name, value))) + '\n')
+
+        with self.phase('copy') as entry, connection.cursor() as cursor:
+            for table, columns, buffer in (('import_goods', GOODS_COLUMNS, goods),
+                                           ('import_parameters', PARAMETER_COLUMNS, parameters)):
+                buffer.seek(0)
+                cursor.copy_expert(f'COPY {table} ({", ".join(columns)}) FROM STDIN', buffer)
+                # COPY идет мимо обертки подсчета запросов
+                entry['queries'] += 1
+            entry['rows'] += len(items)
+
+    def finish(self, shop):
+        """
+        Слияние промежуточных таблиц с каталогом
+        """
+        with self.phase('staging'):
+            for sql in STAGING_INDEX_SQL:
+                self.execute(sql)
+            if self.mode == MODE_DIFF:
+                self.execute(DEDUPLICATE_SQL)
+
+        # Недостающие продукты и параметры фиксируются сразу, как и в upsert_ids
+        with self.phase('products') as entry:
+            entry['inserted'] += insert_missing(Product, ('name', 'category'), self.fetch(MISSING_PRODUCTS_SQL))
+            entry['rows'] += self.execute(RESOLVE_PRODUCTS_SQL)
+
+        with self.phase('parameters') as entry:
+            entry['inserted'] += insert_missing(Parameter, ('name',), self.fetch(MISSING_PARAMETERS_SQL))
+            entry['rows'] += self.execute(RESOLVE_PARAMETERS_SQL)
+
+        if self.mode == MODE_DIFF:
+            with self.phase('product_infos_update') as entry:
+                self.execute(MATCH_OFFERS_SQL, [shop.id])
+                entry['updated'] += self.execute_touching(UPDATE_OFFERS_SQL)
+                entry['rows'] += entry['updated']
+
+        with self.phase('product_infos') as entry:
+            entry['inserted'] += self.execute_touching(INSERT_OFFERS_SQL, [shop.id])
+            entry['rows'] += entry['inserted']
+            self.execute(RESOLVE_NEW_OFFERS_SQL, [shop.id])
+
+        with self.phase('product_parameters') as entry:
+            entry['deleted'] += self.execute_touching(DELETE_PRODUCT_PARAMETERS_SQL)
+            entry['inserted'] += self.execute_touching(INSERT_PRODUCT_PARAMETERS_SQL)
+            entry['rows'] += entry['inserted']
+
+        if self.mode == MODE_DIFF:
+            # Снятие с продажи идет через ORM: нужны каскадное удаление и проверка заказов
+            with connection.cursor() as cursor:
+                cursor.execute(MISSING_OFFERS_SQL.format(**self._tables), [shop.id])
+                missing = [product_info_id for product_info_id, in cursor.fetchall()]
+            self.retire(missing)
+
+        self.execute('DROP TABLE import_goods, import_parameters')
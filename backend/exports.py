@@ -0,0 +1,398 @@
+import csv
+import glob
+import io
+import os
+import tempfile
+import zlib
+from datetime import timedelta
+from itertools import islice
+
+import ujson
+import yaml
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import File
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from backend.feeds import CSV_COLUMNS
+from backend.models import Shop, Category, ProductInfo, Parameter, ExportJob
+
+try:
+    import zstandard
+except ImportError:
+    # Сжатие zstd доступно, только если установлен пакет zstandard
+    zstandard = None
+
+
+# Предложений в одной выборке из БД и в одном фрагменте ответа
+EXPORT_CHUNK_SIZE = 500
+
+DEFAULT_EXPORT_FORMAT = 'yaml'
+
+# Зарегистрированные форматы выгрузки: название -> функция выгрузки, тип содержимого и расширение файла
+EXPORT_FORMATS = {}
+
+# Блок чтения файла выгрузки при отдаче части файла
+DOWNLOAD_BLOCK_SIZE = 64 * 1024
+
+# Сжатие выгрузки: название -> тип содержимого и расширение файла
+EXPORT_COMPRESSIONS = {
+    'gzip': {'content_type': 'application/gzip', 'extension': 'gz'},
+}
+if zstandard is not None:
+    EXPORT_COMPRESSIONS['zstd'] = {'content_type': 'application/zstd', 'extension': 'zst'}
+
+
+def export_format(name, content_type, extension):
+    """
+    Регистрация формата выгрузки. Функция выгрузки принимает магазин и необязательный progress
+    (см. export_chunks) и отдает текст прайс-листа частями; формат совпадает с одноименным форматом импорта
+    """
+    def register(writer):
+        EXPORT_FORMATS[name] = {
+            'writer': writer,
+            'content_type': content_type,
+            'extension': extension,
+        }
+        return writer
+    return register
+
+
+def export_header(shop):
+    return {
+        'shop': shop.name,
+        'categories': [{'id': category.id, 'name': category.name}
+                       for category in Category.objects.filter(shops=shop).distinct()],
+    }
+
+
+def export_goods(shop):
+    """
+    Товары магазина в формате прайс-листа по одному, выборка из БД идет пачками
+    """
+    offers = ProductInfo.objects.filter(shop=shop).select_related('product').prefetch_related(
+        'product_parameters__parameter').order_by('id')
+    for offer in offers.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'id': offer.external_id,
+            'category': offer.product.category_id,
+            'model': offer.model,
+            'name': offer.product.name,
+            'price': float(offer.price),
+            'price_rrc': float(offer.price_rrc),
+            'quantity': offer.quantity,
+            'parameters': {parameter.parameter.name: parameter.value
+                           for parameter in offer.product_parameters.all()},
+        }
+
+
+def export_chunks(shop, progress=None):
+    """
+    Товары магазина списками не длиннее EXPORT_CHUNK_SIZE, по списку на фрагмент ответа.
+    progress получает число выгруженных товаров после каждого списка
+    """
+    goods = export_goods(shop)
+    processed = 0
+    while True:
+        chunk = list(islice(goods, EXPORT_CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+        processed += len(chunk)
+        if progress:
+            progress(processed)
+
+
+@export_format('yaml', content_type='application/x-yaml', extension='yaml')
+def iter_yaml_export(shop, progress=None):
+    """
+    Прайс-лист магазина в YAML по частям. Текст тот же, что у yaml.dump всего прайс-листа
+    с пустой строкой перед goods: элементы списка верхнего уровня пишутся без отступа,
+    поэтому каждый товар можно сериализовать отдельно
+    """
+    yield yaml.dump(export_header(shop), allow_unicode=True, default_flow_style=False, sort_keys=False) + '\n'
+
+    empty = True
+    for chunk in export_chunks(shop, progress):
+        yield ('goods:\n' if empty else '') + ''.join(
+            yaml.dump([item], allow_unicode=True, default_flow_style=False, sort_keys=False) for item in chunk)
+        empty = False
+    # Пустой список goods yaml.dump пишет в строку заголовка
+    if empty:
+        yield 'goods: []\n'
+
+
+@export_format('json', content_type='application/json', extension='json')
+def iter_json_export(shop, progress=None):
+    """
+    Прайс-лист в JSON одним объектом с разделами shop, categories и goods
+    """
+    yield ujson.dumps(export_header(shop), ensure_ascii=False)[:-1] + ', "goods": ['
+    separator = ''
+    for chunk in export_chunks(shop, progress):
+        yield separator + ', '.join(ujson.dumps(item, ensure_ascii=False) for item in chunk)
+        separator = ', '
+    yield ']}'
+
+
+@export_format('ndjson', content_type='application/x-ndjson', extension='ndjson')
+def iter_ndjson_export(shop, progress=None):
+    """
+    Прайс-лист в NDJSON: заголовок с магазином и категориями, затем по товару на строку
+    """
+    yield ujson.dumps(export_header(shop), ensure_ascii=False) + '\n'
+    for chunk in export_chunks(shop, progress):
+        yield ''.join(ujson.dumps(item, ensure_ascii=False) + '\n' for item in chunk)
+
+
+@export_format('csv', content_type='text/csv; charset=utf-8', extension='csv')
+def iter_csv_export(shop, progress=None):
+    """
+    Прайс-лист в CSV: колонки CSV_COLUMNS и по колонке на каждый параметр товаров магазина
+    """
+    categories = {category['id']: category['name'] for category in export_header(shop)['categories']}
+    parameters = sorted(Parameter.objects.filter(product_parameters__product_info__shop=shop).order_by()
+                        .values_list('name', flat=True).distinct())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS + tuple(parameters))
+    for chunk in export_chunks(shop, progress):
+        for item in chunk:
+            writer.writerow([shop.name, item['id'], item['category'], categories.get(item['category'], '')] +
+                            [item[column] for column in CSV_COLUMNS[4:]] +
+                            [item['parameters'].get(name, '') for name in parameters])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def encode_export(chunks, compression=None):
+    """
+    Части выгрузки в UTF-8, при указанном сжатии - сжатые потоком
+    """
+    if compression == 'gzip':
+        # wbits 16 + 15 - поток с заголовком и контрольной суммой gzip
+        compressor = zlib.compressobj(wbits=31)
+    elif compression == 'zstd':
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        compressor = None
+
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        if compressor:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
+
+
+def export_state_key(user_id):
+    return f'export-state:{user_id}'
+
+
+def get_export_state(user_id):
+    """
+    Магазин пользователя и ревизия его каталога: из кэша, при промахе - из БД.
+    None, если у пользователя нет магазина.
+    При промахе значение кладется через add: если пока шло чтение, зафиксированная ревизия уже записана
+    в кэш хуком store_export_state, прочитанное до фиксации значение ее не перезапишет
+    """
+    key = export_state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        state = read_export_state(user_id)
+        if state is None:
+            return None
+        cache.add(key, state, settings.EXPORT_STATE_CACHE_TIMEOUT)
+    return state
+
+
+def read_export_state(user_id):
+    return Shop.objects.filter(user_id=user_id).values('id', 'name', 'catalog_revision').first()
+
+
+def store_export_state(user_id):
+    """
+    Запись в кэш зафиксированной ревизии каталога. После записи ревизия перечитывается: если ее успела
+    поднять параллельная транзакция, хук которой записал свое значение раньше, запись повторяется
+    """
+    key = export_state_key(user_id)
+    while True:
+        state = read_export_state(user_id)
+        if state is None:
+            cache.delete(key)
+            return
+        cache.set(key, state, settings.EXPORT_STATE_CACHE_TIMEOUT)
+        if read_export_state(user_id) == state:
+            return
+
+
+def bump_catalog_revision(shop_id):
+    """
+    Новая ревизия каталога магазина после изменения предложений.
+    Новая ревизия записывается в кэш после фиксации транзакции, до нее отдается прежняя выгрузка
+    """
+    Shop.objects.filter(id=shop_id).update(catalog_revision=F('catalog_revision') + 1)
+    user_id = Shop.objects.filter(id=shop_id).values_list('user_id', flat=True).first()
+    if user_id:
+        transaction.on_commit(lambda: store_export_state(user_id))
+
+
+def export_name(state, format=DEFAULT_EXPORT_FORMAT, compression=None):
+    """
+    Имя файла выгрузки в кэше: магазин, ревизия каталога, формат и сжатие
+    """
+    name = f'shop{state["id"]}-r{state["catalog_revision"]}.{EXPORT_FORMATS[format]["extension"]}'
+    if compression:
+        name += f'.{EXPORT_COMPRESSIONS[compression]["extension"]}'
+    return name
+
+
+def export_etag(name):
+    return f'"{name}"'
+
+
+def export_cache_path(name):
+    return os.path.join(settings.EXPORT_CACHE_DIR, name)
+
+
+def cache_export(chunks, path):
+    """
+    Отдача частей выгрузки с записью в файл кэша. Под своим именем файл появляется только
+    после полной выгрузки, при обрыве соединения временный файл удаляется.
+    Выгрузки прежних ревизий магазина удаляются, других форматов той же ревизии - остаются
+    """
+    directory, name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    file = tempfile.NamedTemporaryFile('wb', dir=directory, suffix='.tmp', delete=False)
+    try:
+        with file:
+            for chunk in chunks:
+                file.write(chunk)
+                yield chunk
+        os.replace(file.name, path)
+    except BaseException:
+        os.unlink(file.name)
+        raise
+
+    revision = name.split('.')[0]
+    for stale in glob.glob(os.path.join(directory, f'{revision.split("-r")[0]}-r*')):
+        if os.path.basename(stale).split('.')[0] != revision:
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+
+def find_export_job(user_id, state, format, compression):
+    """
+    Задача выгрузки того же формата, к которой можно присоединиться: еще не выполненная
+    или готовая по текущей ревизии каталога, файл которой не удален
+    """
+    return ExportJob.objects.filter(
+        Q(state__in=('queued', 'running')) |
+        Q(state='done', catalog_revision=state['catalog_revision'], expires_at__gt=timezone.now()),
+        user_id=user_id, format=format, compression=compression or '',
+    ).first()
+
+
+def run_export_job(job_id):
+    """
+    Выгрузка прайс-листа задачи в файл. Прогресс сохраняется в ExportJob после каждой пачки товаров,
+    готовый файл хранится EXPORT_JOB_TTL секунд
+    """
+    job = ExportJob.objects.select_related('shop').get(id=job_id)
+    if job.state != 'queued':
+        return job
+
+    job.state = 'running'
+    job.started_at = timezone.now()
+    job.catalog_revision = Shop.objects.filter(id=job.shop_id).values_list('catalog_revision', flat=True).get()
+    job.total = ProductInfo.objects.filter(shop_id=job.shop_id).count()
+    job.save(update_fields=['state', 'started_at', 'catalog_revision', 'total'])
+
+    def progress(processed):
+        job.processed = processed
+        ExportJob.objects.filter(id=job.id).update(processed=processed)
+
+    compression = job.compression or None
+    try:
+        chunks = encode_export(EXPORT_FORMATS[job.format]['writer'](job.shop, progress), compression)
+        name = export_name({'id': job.shop_id, 'catalog_revision': job.catalog_revision}, job.format, compression)
+        with File(tempfile.TemporaryFile()) as file:
+            for chunk in chunks:
+                file.write(chunk)
+            file.seek(0)
+            job.file.save(name, file, save=False)
+        job.size = job.file.size
+        job.expires_at = timezone.now() + timedelta(seconds=settings.EXPORT_JOB_TTL)
+        job.state = 'done'
+    except Exception as e:
+        job.state = 'failed'
+        job.errors = job.errors + [str(e)]
+    job.finished_at = timezone.now()
+    job.save(update_fields=['state', 'processed', 'errors', 'file', 'size', 'expires_at', 'finished_at'])
+    return job
+
+
+def collect_export_jobs():
+    """
+    Удаление задач выгрузки с истекшим сроком хранения файла и завершенных с ошибкой раньше EXPORT_JOB_TTL.
+    Возвращает число удаленных задач
+    """
+    now = timezone.now()
+    stale = ExportJob.objects.filter(
+        Q(expires_at__lt=now) |
+        Q(state='failed', created_at__lt=now - timedelta(seconds=settings.EXPORT_JOB_TTL)))
+    deleted = 0
+    for job in stale:
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        deleted += 1
+    return deleted
+
+
+def parse_range(header, size):
+    """
+    Диапазон байтов (начало, конец включительно) из заголовка Range с одним диапазоном.
+    None - заголовка нет, он некорректен или содержит несколько диапазонов: тогда отдается весь файл.
+    ValueError - диапазон за пределами файла
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, separator, last = header[len('bytes='):].strip().partition('-')
+    if not separator or not (first or last) or not all(part.isdigit() for part in (first, last) if part):
+        return None
+
+    if not first:
+        # bytes=-N - последние N байт
+        if not int(last) or not size:
+            raise ValueError('Пустой диапазон')
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError('Диапазон за пределами файла')
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def iter_file_range(file, start, end):
+    """
+    Байты файла с start по end включительно блоками DOWNLOAD_BLOCK_SIZE, затем файл закрывается
+    """
+    with file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = file.read(min(DOWNLOAD_BLOCK_SIZE, remaining))
+            if not block:
+                return
+            remaining -= len(block)
+            yield block
@@ -0,0 +1,112 @@
+import math
+import re
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+
+from backend.locks import lock_category_facets
+from backend.models import Parameter, ParameterFacet, ProductParameter
+
+
+# Фасетов в одном INSERT при пересчете
+FACET_BATCH_SIZE = 5000
+
+# Фильтр товаров по параметру в запросе: param[Цвет]=черный, param[Диагональ (дюйм)]__gte=6
+PARAMETER_FILTER = re.compile(r'^param\[(?P<name>.+)\](?:__(?P<lookup>gte|lte|gt|lt))?$')
+
+
+def to_number(value):
+    """
+    Значение параметра как число для фильтров по диапазону, None - не число
+    """
+    try:
+        number = float(str(value).strip().replace(',', '.'))
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def refresh_facets(category_ids):
+    """
+    Пересчет фасетов категорий: число предложений открытых магазинов по каждому значению параметра.
+    Категории блокируются рекомендательными блокировками, поэтому импорты магазинов с общими категориями
+    пересчитывают их по очереди. Возвращает число фасетов
+    """
+    category_ids = sorted(set(category_ids))
+    with transaction.atomic():
+        lock_category_facets(category_ids)
+        ParameterFacet.objects.filter(category_id__in=category_ids).delete()
+
+        counts = ProductParameter.objects.filter(
+            product_info__product__category_id__in=category_ids, product_info__shop__state=True,
+        ).values_list('product_info__product__category_id', 'parameter_id', 'value').annotate(
+            offers=Count('id')).order_by()
+        facets = (ParameterFacet(category_id=category_id, parameter_id=parameter_id, value=value,
+                                 value_number=to_number(value), offers=offers)
+                  for category_id, parameter_id, value, offers in counts.iterator(chunk_size=FACET_BATCH_SIZE))
+        created = 0
+        while True:
+            chunk = list(islice(facets, FACET_BATCH_SIZE))
+            if not chunk:
+                return created
+            ParameterFacet.objects.bulk_create(chunk)
+            created += len(chunk)
+
+
+def parse_parameter_filters(query_params):
+    """
+    Фильтры по параметрам из параметров запроса: список (имя параметра, сравнение, значения).
+    Без сравнения - любое из значений (параметр можно повторить), со сравнением - одно число.
+    ValueError - сравнение не с числом
+    """
+    filters = []
+    for key in query_params:
+        match = PARAMETER_FILTER.match(key)
+        if not match:
+            continue
+        values = query_params.getlist(key)
+        if match['lookup']:
+            number = to_number(values[-1])
+            if number is None:
+                raise ValueError(f'{key}: ожидается число')
+            values = [number]
+        filters.append((match['name'], match['lookup'], values))
+    return filters
+
+
+def filter_by_parameters(queryset, filters, category_id=None):
+    """
+    Отбор предложений по параметрам: по условию EXISTS на каждый параметр по индексу
+    (параметр, значение, предложение). Для сравнений подходящие значения берутся из фасетов
+    по числовому значению, поэтому сравнение идет по небольшому справочнику значений,
+    а не по всем параметрам предложений
+    """
+    if not filters:
+        return queryset
+    parameter_ids = dict(Parameter.objects.filter(name__in={name for name, _, _ in filters})
+                         .values_list('name', 'id'))
+    for name, lookup, values in filters:
+        parameter_id = parameter_ids.get(name)
+        if parameter_id is None:
+            return queryset.none()
+        if lookup:
+            facets = ParameterFacet.objects.filter(parameter_id=parameter_id, **{f'value_number__{lookup}': values[0]})
+            if category_id:
+                facets = facets.filter(category_id=category_id)
+            values = facets.values('value')
+        queryset = queryset.filter(Exists(ProductParameter.objects.filter(
+            product_info=OuterRef('pk'), parameter_id=parameter_id, value__in=values)))
+    return queryset
+
+
+def category_facets(category_id):
+    """
+    Значения параметров категории с числом предложений, по убыванию числа предложений
+    """
+    facets = {}
+    rows = ParameterFacet.objects.filter(category_id=category_id).order_by(
+        'parameter__name', '-offers', 'value').values_list('parameter__name', 'value', 'offers')
+    for name, value, offers in rows:
+        facets.setdefault(name, []).append({'value': value, 'count': offers})
+    return [{'parameter': name, 'values': values} for name, values in facets.items()]
@@ -0,0 +1,573 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import zipfile
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+from urllib.parse import urlparse
+
+import yaml
+from billiard import Pool
+from django.conf import settings
+from requests import get
+from yaml.events import (
+    AliasEvent, ScalarEvent, SequenceStartEvent, SequenceEndEvent, MappingStartEvent, MappingEndEvent,
+    StreamStartEvent, DocumentStartEvent
+)
+from yaml.nodes import ScalarNode, SequenceNode, MappingNode
+
+# Событийный парсер libyaml, если PyYAML собран с ним, иначе безопасный парсер на Python
+if yaml.__with_libyaml__:
+    from yaml import CSafeLoader as FeedLoader
+else:
+    from yaml import SafeLoader as FeedLoader
+
+
+# Обязательные разделы прайс-листа
+REQUIRED_FIELDS = ('shop', 'categories', 'goods')
+
+# Размер блока чтения тела HTTP ответа
+READ_CHUNK_SIZE = 64 * 1024
+
+# Прайс-листы больше этого размера при загрузке сбрасываются из памяти во временный файл
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Таймаут соединения и чтения очередного блока при загрузке прайс-листа
+FETCH_TIMEOUT = 20
+
+
+# Формат прайс-листа, если его не удалось определить по Content-Type и расширению
+DEFAULT_FORMAT = 'yaml'
+
+# Колонки CSV прайс-листа, остальные колонки - параметры товара
+CSV_COLUMNS = ('shop', 'id', 'category', 'category_name', 'model', 'name', 'price', 'price_rrc', 'quantity')
+
+# Файлы архива больше этого размера (после распаковки) не принимаются
+ARCHIVE_MAX_MEMBER_SIZE = 512 * 1024 * 1024
+
+# Зарегистрированные форматы: название -> парсер, типы содержимого и расширения файлов
+FEED_FORMATS = {}
+
+
+class FeedError(ValueError):
+    """Ошибка структуры прайс-листа"""
+
+
+def feed_format(name, content_types=(), extensions=()):
+    """
+    Регистрация парсера формата прайс-листа.
+    Парсер принимает бинарный файловый объект и возвращает словарь с shop, categories
+    и goods, где goods - итератор товаров
+    """
+    def register(parser):
+        FEED_FORMATS[name] = {
+            'parser': parser,
+            'content_types': content_types,
+            'extensions': extensions,
+        }
+        return parser
+    return register
+
+
+def detect_format(content_type='', filename=''):
+    """
+    Формат прайс-листа по Content-Type, затем по расширению имени файла или URL
+    """
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    for name, feed in FEED_FORMATS.items():
+        if content_type in feed['content_types']:
+            return name
+
+    extension = os.path.splitext(urlparse(filename or '').path)[1].lower()
+    for name, feed in FEED_FORMATS.items():
+        if extension in feed['extensions']:
+            return name
+    return DEFAULT_FORMAT
+
+
+def check_required(data):
+    missing = [field for field in REQUIRED_FIELDS if field not in data]
+    if missing:
+        raise FeedError(f'Отсутствует обязательное поле: {missing[0]}')
+
+
+class YamlFeedParser:
+    """
+    Потоковый разбор YAML прайс-листа по событиям парсера.
+    Разделы shop и categories читаются целиком, товары из goods собираются и отдаются по одному,
+    поэтому в памяти одновременно находится только один товар, а не все дерево документа.
+    """
+
+    def __init__(self, stream):
+        self.loader = FeedLoader(stream)
+        self.anchors = {}
+
+    def parse(self):
+        """
+        Возвращает словарь прайс-листа, в котором goods - генератор товаров.
+        Если goods идет в документе раньше shop или categories, товары читаются в список
+        """
+        self.expect(StreamStartEvent)
+        self.expect(DocumentStartEvent)
+        self.expect(MappingStartEvent)
+
+        data = {}
+        while not self.loader.check_event(MappingEndEvent):
+            key = self.construct(self.compose(self.loader.get_event()))
+            if key != 'goods':
+                data[key] = self.construct(self.compose(self.loader.get_event()))
+            elif {'shop', 'categories'} <= data.keys():
+                data['goods'] = self.iter_goods()
+                return data
+            else:
+                data['goods'] = list(self.iter_goods(close=False))
+
+        self.loader.dispose()
+        check_required(data)
+        return data
+
+    def iter_goods(self, close=True):
+        """
+        Генератор товаров раздела goods
+        """
+        if self.loader.check_event(SequenceStartEvent):
+            self.loader.get_event()
+            while not self.loader.check_event(SequenceEndEvent):
+                yield self.construct(self.compose(self.loader.get_event()))
+            self.loader.get_event()
+        else:
+            goods = self.construct(self.compose(self.loader.get_event()))
+            if goods:
+                raise FeedError('Раздел goods должен быть списком')
+        if close:
+            # Оставшиеся после goods разделы не нужны для импорта
+            self.loader.dispose()
+
+    def compose(self, event):
+        """
+        Сборка узла документа из события и следующих за ним событий
+        """
+        if isinstance(event, AliasEvent):
+            return self.anchors[event.anchor]
+
+        if isinstance(event, ScalarEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = self.loader.resolve(ScalarNode, event.value, event.implicit)
+            node = ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+        elif isinstance(event, SequenceStartEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = self.loader.resolve(SequenceNode, None, event.implicit)
+            node = SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            while not self.loader.check_event(SequenceEndEvent):
+                node.value.append(self.compose(self.loader.get_event()))
+            node.end_mark = self.loader.get_event().end_mark
+        elif isinstance(event, MappingStartEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = self.loader.resolve(MappingNode, None, event.implicit)
+            node = MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            while not self.loader.check_event(MappingEndEvent):
+                key = self.compose(self.loader.get_event())
+                node.value.append((key, self.compose(self.loader.get_event())))
+            node.end_mark = self.loader.get_event().end_mark
+        else:
+            raise FeedError(f'Неожиданный элемент YAML: {event}')
+
+        if event.anchor is not None:
+            self.anchors[event.anchor] = node
+        return node
+
+    def construct(self, node):
+        return self.loader.construct_document(node)
+
+    def expect(self, event_class):
+        event = self.loader.get_event()
+        if not isinstance(event, event_class):
+            raise FeedError(f'Неожиданный элемент YAML: {event}')
+        return event
+
+
+@feed_format('yaml', content_types=('application/x-yaml', 'application/yaml', 'text/yaml', 'text/x-yaml'),
+             extensions=('.yaml', '.yml'))
+def parse_yaml(stream):
+    """
+    Потоковый разбор YAML прайс-листа из строки, байтов или файлового объекта
+    """
+    return YamlFeedParser(stream).parse()
+
+
+class JsonFeedParser:
+    """
+    Потоковый разбор JSON прайс-листа той же структуры, что и YAML.
+    Файл читается блоками, товары из goods декодируются по одному через JSONDecoder.raw_decode
+    """
+
+    def __init__(self, file):
+        self.reader = io.TextIOWrapper(file, encoding='utf-8-sig')
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def parse(self):
+        self.expect('{')
+        data = {}
+        if self.peek() == '}':
+            self.pos += 1
+        else:
+            while True:
+                key = self.value()
+                self.expect(':')
+                if key != 'goods':
+                    data[key] = self.value()
+                elif {'shop', 'categories'} <= data.keys():
+                    data['goods'] = self.iter_goods()
+                    return data
+                else:
+                    data['goods'] = list(self.iter_goods())
+                if self.next_separator('}'):
+                    break
+        check_required(data)
+        return data
+
+    def iter_goods(self):
+        """
+        Генератор товаров раздела goods
+        """
+        if self.peek() != '[':
+            if self.value():
+                raise FeedError('Раздел goods должен быть списком')
+            return
+        self.pos += 1
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.next_separator(']'):
+                return
+
+    def value(self):
+        """
+        Декодирование очередного значения. Если значение обрывается на границе блока, дочитываем файл
+        """
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as error:
+                if self.fill():
+                    continue
+                raise FeedError(f'Некорректный JSON: {error}')
+            # Число в конце буфера могло быть прочитано не полностью
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def next_separator(self, closing):
+        """
+        Разделитель элементов: True, если контейнер закрыт, False после запятой
+        """
+        char = self.peek()
+        self.pos += 1
+        if char == closing:
+            return True
+        if char != ',':
+            raise FeedError(f'Некорректный JSON: ожидалось "," или "{closing}"')
+        return False
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.reader.read(READ_CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def skip_whitespace(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return
+
+    def peek(self):
+        self.skip_whitespace()
+        return self.buffer[self.pos] if self.pos < len(self.buffer) else ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise FeedError(f'Некорректный JSON: ожидалось "{char}"')
+        self.pos += 1
+
+
+@feed_format('json', content_types=('application/json', 'text/json'), extensions=('.json',))
+def parse_json(file):
+    """
+    Потоковый разбор JSON прайс-листа
+    """
+    return JsonFeedParser(file).parse()
+
+
+@feed_format('ndjson', content_types=('application/x-ndjson', 'application/ndjson', 'application/jsonlines',
+                                      'application/x-jsonlines'),
+             extensions=('.ndjson', '.jsonl'))
+def parse_ndjson(file):
+    """
+    Разбор NDJSON прайс-листа: первая строка - объект с shop и categories, каждая следующая - товар
+    """
+    lines = (line for line in io.TextIOWrapper(file, encoding='utf-8-sig') if line.strip())
+    try:
+        data = json.loads(next(lines, '{}'))
+    except json.JSONDecodeError as error:
+        raise FeedError(f'Некорректный JSON в заголовке: {error}')
+    if not isinstance(data, dict):
+        raise FeedError('Первая строка NDJSON должна быть объектом с shop и categories')
+    data['goods'] = iter_ndjson_goods(lines)
+    check_required(data)
+    return data
+
+
+def iter_ndjson_goods(lines):
+    for number, line in enumerate(lines, start=2):
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as error:
+            raise FeedError(f'Некорректный JSON в строке {number}: {error}')
+
+
+@feed_format('csv', content_types=('text/csv', 'application/csv'), extensions=('.csv',))
+def parse_csv(file):
+    """
+    Разбор CSV прайс-листа: строка на товар, колонки CSV_COLUMNS, остальные колонки - параметры,
+    пустая ячейка параметра означает его отсутствие.
+    Магазин и категории собираются первым проходом по файлу, товары отдаются вторым
+    """
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    reader = csv_reader(text)
+    missing = [column for column in CSV_COLUMNS if column != 'category_name' and column not in reader.fieldnames]
+    if missing:
+        raise FeedError(f'Отсутствует обязательная колонка: {missing[0]}')
+
+    shop = None
+    categories = {}
+    for row in reader:
+        shop = shop or row['shop']
+        categories.setdefault(row['category'], row.get('category_name') or row['category'])
+    if not shop:
+        raise FeedError('Не указан магазин в колонке shop')
+
+    # Отсоединяем обертку, чтобы она не закрыла файл, и читаем товары заново с начала
+    text.detach()
+    file.seek(0)
+    return {
+        'shop': shop,
+        'categories': [{'id': category_id, 'name': name} for category_id, name in categories.items()],
+        'goods': iter_csv_goods(csv_reader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))),
+    }
+
+
+def iter_csv_goods(reader):
+    parameters = [column for column in reader.fieldnames if column not in CSV_COLUMNS]
+    for row in reader:
+        item = {column: row[column] for column in CSV_COLUMNS if column in row and column not in ('shop', 'category_name')}
+        item['parameters'] = {name: row[name] for name in parameters if row[name] not in (None, '')}
+        yield item
+
+
+def csv_reader(text):
+    """
+    DictReader с определением разделителя (запятая, точка с запятой или табуляция)
+    """
+    sample = text.read(READ_CHUNK_SIZE)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(text, dialect=dialect)
+    if not reader.fieldnames:
+        raise FeedError('Пустой CSV файл')
+    reader.fieldnames = [name.strip() for name in reader.fieldnames]
+    return reader
+
+
+def archive_members(archive):
+    """
+    Прайс-листы в архиве: файлы известных форматов, кроме вложенных архивов и служебных файлов
+    """
+    extensions = {extension for name, feed in FEED_FORMATS.items() if name != 'zip'
+                  for extension in feed['extensions']}
+    members = []
+    for info in archive.infolist():
+        name = os.path.basename(info.filename)
+        if info.is_dir() or name.startswith('.') or info.filename.startswith('__MACOSX/'):
+            continue
+        if os.path.splitext(name)[1].lower() not in extensions:
+            continue
+        if info.file_size > ARCHIVE_MAX_MEMBER_SIZE:
+            raise FeedError(f'Файл {info.filename} в архиве больше {ARCHIVE_MAX_MEMBER_SIZE // 2 ** 20} МБ')
+        members.append(info)
+    return members
+
+
+def parse_archive_member(name, content):
+    """
+    Разбор товаров одного файла архива в отдельном процессе
+    """
+    return list(FEED_FORMATS[detect_format(filename=name)]['parser'](io.BytesIO(content))['goods'])
+
+
+def archive_workers():
+    """
+    Число процессов разбора архива
+    """
+    return settings.FEED_ARCHIVE_WORKERS or os.cpu_count() or 1
+
+
+def iter_archive_goods(archive, members, workers):
+    """
+    Товары всех файлов архива по порядку файлов. Файлы разбираются параллельно в пуле процессов billiard,
+    который, в отличие от multiprocessing, запускается и в демоническом процессе воркера Celery prefork.
+    В работе одновременно не больше двух файлов на процесс, чтобы не держать весь архив в памяти
+    """
+    if workers <= 1:
+        for info in members:
+            with archive.open(info) as member:
+                yield from FEED_FORMATS[detect_format(filename=info.filename)]['parser'](member)['goods']
+        return
+
+    pool = Pool(processes=workers)
+    try:
+        members = iter(members)
+        pending = deque(pool.apply_async(parse_archive_member, (info.filename, archive.read(info)))
+                        for info in islice(members, workers * 2))
+        while pending:
+            goods = pending.popleft().get()
+            info = next(members, None)
+            if info is not None:
+                pending.append(pool.apply_async(parse_archive_member, (info.filename, archive.read(info))))
+            yield from goods
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+@feed_format('zip', content_types=('application/zip', 'application/x-zip-compressed'), extensions=('.zip',))
+def parse_zip(file):
+    """
+    Разбор архива прайс-листов, например по файлу на категорию. Во всех файлах должен быть один магазин.
+    Магазин и категории собираются из заголовков файлов, товары разбираются в пуле процессов
+    и отдаются одним потоком в общий пакетный импорт
+    """
+    try:
+        archive = zipfile.ZipFile(file)
+    except zipfile.BadZipFile as error:
+        raise FeedError(f'Некорректный архив: {error}')
+
+    members = archive_members(archive)
+    if not members:
+        raise FeedError('В архиве нет прайс-листов')
+
+    shop = None
+    categories = {}
+    for info in members:
+        with archive.open(info) as member:
+            data = FEED_FORMATS[detect_format(filename=info.filename)]['parser'](member)
+            if shop is None:
+                shop = data['shop']
+            elif data['shop'] != shop:
+                raise FeedError(f'В файле {info.filename} другой магазин: {data["shop"]}')
+            for category in data['categories']:
+                categories.setdefault(category['id'], category)
+            close = getattr(data['goods'], 'close', None)
+            if close:
+                close()
+
+    return {
+        'shop': shop,
+        'categories': list(categories.values()),
+        'goods': iter_archive_goods(archive, members, archive_workers()),
+    }
+
+
+class Feed:
+    """
+    Загруженный прайс-лист с заголовками для условных запросов и хэшем содержимого
+    """
+
+    def __init__(self, file=None, format=DEFAULT_FORMAT, etag='', last_modified='', content_hash='',
+                 not_modified=False):
+        self.file = file
+        self.format = format
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.not_modified = not_modified
+
+    def parse(self):
+        return FEED_FORMATS[self.format]['parser'](self.file)
+
+
+@contextmanager
+def fetch_feed(url, etag='', last_modified=''):
+    """
+    Загрузка прайс-листа по URL условным запросом.
+    Тело ответа читается блоками во временный файл (на диск, если он больше SPOOL_MAX_SIZE)
+    с подсчетом хэша, чтобы неизменившийся прайс можно было пропустить до разбора и импорта
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    with get(url, timeout=FETCH_TIMEOUT, stream=True, headers=headers) as response:
+        if response.status_code == 304:
+            yield Feed(etag=etag, last_modified=last_modified, not_modified=True)
+            return
+        response.raise_for_status()
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as file:
+            digest = hashlib.sha256()
+            for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                digest.update(chunk)
+                file.write(chunk)
+            file.seek(0)
+            yield Feed(file,
+                       format=detect_format(response.headers.get('Content-Type'), url),
+                       etag=response.headers.get('ETag', ''),
+                       last_modified=response.headers.get('Last-Modified', ''),
+                       content_hash=digest.hexdigest())
+
+
+@contextmanager
+def open_feed(path):
+    """
+    Прайс-лист из локального файла. Формат определяется по расширению, файлы .gz распаковываются на лету.
+    Хэш содержимого считается отдельным проходом по файлу блоками
+    """
+    path = str(path)
+    with open(path, 'rb') as file:
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: file.read(READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        file.seek(0)
+
+        name, extension = os.path.splitext(path)
+        if extension.lower() == '.gz':
+            with gzip.GzipFile(fileobj=file) as archive:
+                yield Feed(archive, format=detect_format(filename=name), content_hash=digest.hexdigest())
+        else:
+            yield Feed(file, format=detect_format(filename=path), content_hash=digest.hexdigest())
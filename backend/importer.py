@@ -0,0 +1,531 @@
+import time
+import tracemalloc
+from contextlib import contextmanager, ExitStack
+from decimal import Decimal
+from itertools import islice
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from backend.catalog import refresh_catalog_entries
+from backend.exports import bump_catalog_revision
+from backend.facets import refresh_facets
+from backend.search import update_search_vectors
+from backend.feeds import fetch_feed, open_feed
+from backend.locks import import_lock
+from backend.scheduler import active_jobs, update_shop_schedule
+from backend.upserts import insert_missing, upsert_ids
+from backend.versions import create_catalog_version
+from backend.models import (
+    Shop, Category, Product, ProductInfo, Parameter, ProductParameter, OrderItem, ImportJob, ShopFeed
+)
+
+
+# Размер пачки товаров, обрабатываемой за один проход
+BATCH_SIZE = 1000
+
+# Режимы импорта: сравнение с текущим каталогом или полная перезаливка
+MODE_DIFF = 'diff'
+MODE_REPLACE = 'replace'
+IMPORT_MODES = (MODE_DIFF, MODE_REPLACE)
+
+# Способы записи каталога в БД: через ORM или COPY во временную таблицу и слияние SQL
+IMPORT_METHOD_ORM = 'orm'
+IMPORT_METHOD_COPY = 'copy'
+
+# Счетчики этапа импорта: обработанные, вставленные, обновленные и удаленные строки, запросы к БД
+PHASE_COUNTERS = ('rows', 'inserted', 'updated', 'deleted', 'queries')
+
+# Поля предложения, изменения которых приводят к UPDATE
+PRODUCT_INFO_FIELDS = ('product_id', 'model', 'price', 'price_rrc', 'quantity')
+
+
+def chunked(iterable, size):
+    """
+    Разбивает последовательность на списки не длиннее size
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def get_importer_class(user_id):
+    """
+    Класс импорта по настройке магазина пользователя: ORM (по умолчанию) или COPY через промежуточную таблицу.
+    COPY доступен только на PostgreSQL
+    """
+    from backend.copy_importer import CopyCatalogImporter
+
+    if user_id is None:
+        return CatalogImporter
+    method = Shop.objects.filter(user_id=user_id).values_list('import_method', flat=True).first()
+    if method == IMPORT_METHOD_COPY and connection.vendor == 'postgresql':
+        return CopyCatalogImporter
+    return CatalogImporter
+
+
+def run_import_job(job_id, progress=None):
+    """
+    Выполнение задачи импорта с сохранением результата, ошибок и статистики в ImportJob.
+    Импорт идет в одной транзакции, поэтому текущий прогресс передается через progress,
+    а не записывается в ImportJob.
+    Если текущий каталог магазина собран из этого же прайс-листа и тот не изменился
+    (ответ 304 или тот же хэш содержимого), работа с каталогом пропускается. Загруженный файл удаляется после импорта.
+
+    Импорты одного магазина выполняются по очереди под рекомендательной блокировкой.
+    Если идет другой импорт магазина или есть более ранняя задача в очереди, задача остается
+    в статусе queued и должна быть запущена повторно позже
+    """
+    job = ImportJob.objects.get(id=job_id)
+    if job.state != 'queued':
+        return job
+
+    if job.created_at < timezone.now() - timedelta(seconds=settings.IMPORT_JOB_TIMEOUT):
+        job.state = 'failed'
+        job.errors = job.errors + ['Превышено время ожидания в очереди импорта']
+        job.finished_at = timezone.now()
+        job.save(update_fields=['state', 'errors', 'finished_at'])
+        return job
+
+    with import_lock(job.user_id) as acquired:
+        if not acquired or active_jobs().filter(user_id=job.user_id, id__lt=job.id).exists():
+            return job
+        return execute_import_job(job, progress)
+
+
+def execute_import_job(job, progress=None):
+    """
+    Загрузка, разбор и импорт прайс-листа задачи
+    """
+    job.state = 'running'
+    job.started_at = timezone.now()
+    job.save(update_fields=['state', 'started_at'])
+
+    feed_state = ShopFeed.objects.filter(shop__user_id=job.user_id, url=job.url).first()
+    if feed_state and not job.force:
+        etag, last_modified = feed_state.etag, feed_state.last_modified
+    else:
+        etag, last_modified = '', ''
+
+    importer = get_importer_class(job.user_id)(user_id=job.user_id, mode=job.mode, progress=progress, job=job)
+    # Пиковая память считается через tracemalloc, если он не запущен кем-то еще
+    trace_memory = settings.IMPORT_TRACE_MEMORY and not tracemalloc.is_tracing()
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        with ExitStack() as stack:
+            with importer.phase('fetch'):
+                if job.rollback_version is not None:
+                    # Версию могли удалить, пока задача ждала в очереди: ссылка на нее тогда обнулена
+                    if not job.rollback_to_id:
+                        raise ValueError(f'Версия каталога {job.rollback_version} больше недоступна')
+                    feed = stack.enter_context(open_feed(job.rollback_to.file.path))
+                elif job.file:
+                    feed = stack.enter_context(open_feed(job.file.path))
+                else:
+                    feed = stack.enter_context(fetch_feed(job.url, etag=etag, last_modified=last_modified))
+
+            if not job.force and (feed.not_modified or (
+                    feed_state and feed.content_hash == feed_state.content_hash)):
+                job.shop_id = feed_state.shop_id
+                job.state = 'skipped'
+            else:
+                data = feed.parse()
+                if isinstance(data['goods'], list):
+                    job.total = len(data['goods'])
+                    job.save(update_fields=['total'])
+                job.shop = importer.run(data)
+                job.state = 'done'
+                job.errors = job.errors + importer.errors
+            if job.rollback_version is None:
+                save_feed_state(job, feed)
+    except Exception as e:
+        job.state = 'failed'
+        job.errors = job.errors + [str(e)]
+    finally:
+        if trace_memory:
+            job.peak_memory = importer.peak_memory
+            tracemalloc.stop()
+    if job.file:
+        job.file.delete(save=False)
+    job.processed = importer.processed
+    job.stats = importer.stats
+    job.queries, job.rows_inserted, job.rows_updated, job.rows_deleted = (
+        sum(entry[counter] for entry in importer.stats.values())
+        for counter in ('queries', 'inserted', 'updated', 'deleted'))
+    job.finished_at = timezone.now()
+    job.save(update_fields=['shop', 'file', 'state', 'errors', 'processed', 'stats', 'queries', 'rows_inserted',
+                            'rows_updated', 'rows_deleted', 'peak_memory', 'finished_at'])
+    update_shop_schedule(job)
+    return job
+
+
+def save_catalog_version(job, shop, changed):
+    """
+    После отката текущей становится версия, к которой откатились, после импорта, изменившего каталог, -
+    снимок нового каталога. Если импорт ничего не изменил, текущая версия остается прежней
+    """
+    if job.rollback_to_id:
+        Shop.objects.filter(id=shop.id).update(catalog_version_id=job.rollback_to_id)
+    elif changed:
+        create_catalog_version(shop, job)
+
+
+def save_feed_state(job, feed):
+    """
+    Сохранение ETag, Last-Modified и хэша прайс-листа для следующих условных загрузок
+    """
+    now = timezone.now()
+    defaults = {'checked_at': now}
+    if not feed.not_modified:
+        defaults.update(etag=feed.etag, last_modified=feed.last_modified, content_hash=feed.content_hash)
+    if job.state == 'done':
+        defaults['imported_at'] = now
+    ShopFeed.objects.update_or_create(shop_id=job.shop_id, url=job.url, defaults=defaults)
+
+
+class CatalogImporter:
+    """
+    Пакетный импорт прайс-листа поставщика.
+    Категории, продукты и параметры разрешаются несколькими запросами на пачку товаров,
+    предложения и их параметры записываются через bulk_create.
+
+    В режиме diff товары сопоставляются с текущими предложениями магазина по external_id:
+    обновляются только изменившиеся, новые добавляются, пропавшие из прайса снимаются с продажи.
+    ИД предложений при этом сохраняются, и позиции корзин и заказов не теряются.
+    """
+
+    def __init__(self, user_id, batch_size=BATCH_SIZE, mode=MODE_DIFF, progress=None, job=None):
+        if mode not in IMPORT_MODES:
+            raise ValueError(f'Неизвестный режим импорта: {mode}')
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.mode = mode
+        # Вызывается после каждой пачки с числом обработанных товаров
+        self.progress = progress
+        # Задача импорта: по ней в транзакции импорта сохраняется версия каталога, без задачи версии не ведутся
+        self.job = job
+        self.processed = 0
+        # Этап -> время, обработанные, вставленные, обновленные и удаленные строки, запросы к БД и пик памяти
+        self.stats = {}
+        self.peak_memory = 0
+        # Ошибки этапов после фиксации импорта: импорт при них остается выполненным
+        self.errors = []
+        # Кэши уже известных ИД: (название, категория) -> продукт, название -> параметр
+        self._products = {}
+        self._parameters = {}
+        # Текущие предложения магазина: external_id -> (id, product_id, model, price, price_rrc, quantity)
+        self._existing = {}
+        # Предложения, которые нужно снять с продажи (дубли external_id)
+        self._stale = []
+        self._seen = set()
+        # Вставленные и измененные предложения: по ним пересобираются поиск и каталог для выдачи
+        self._touched = set()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Замер этапа импорта: время, число запросов к БД и, если запущен tracemalloc, пик памяти.
+        Значения накапливаются между пачками
+        """
+        entry = self.stats.setdefault(name, dict.fromkeys(PHASE_COUNTERS, 0) | {'seconds': 0.0})
+
+        def count_query(execute, sql, params, many, context):
+            entry['queries'] += 1
+            return execute(sql, params, many, context)
+
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        started = time.monotonic()
+        try:
+            with connection.execute_wrapper(count_query):
+                yield entry
+        finally:
+            entry['seconds'] = round(entry['seconds'] + time.monotonic() - started, 3)
+            if tracemalloc.is_tracing():
+                peak = tracemalloc.get_traced_memory()[1]
+                entry['peak_memory'] = max(entry.get('peak_memory', 0), peak)
+                self.peak_memory = max(self.peak_memory, peak)
+
+    def run(self, data):
+        """
+        Импорт прайс-листа: магазин, категории и товары
+        """
+        with transaction.atomic():
+            shop = self.import_shop(data['shop'])
+            self.import_categories(shop, data['categories'])
+            self.prepare(shop)
+
+            for items in self.read_goods(data['goods']):
+                self.import_goods(shop, items)
+                self.processed += len(items)
+                if self.progress:
+                    self.progress(self.processed)
+
+            self.finish(shop)
+            changed = any(entry[counter] for entry in self.stats.values()
+                          for counter in ('inserted', 'updated', 'deleted'))
+            # Поиск и каталог для выдачи обновляются в транзакции импорта и сразу согласованы с новым каталогом.
+            # Пересобираются только затронутые предложения, записи удаленных удаляются каскадно
+            touched = sorted(self._touched)
+            with self.phase('search') as entry:
+                entry['rows'] += len(touched)
+                entry['updated'] += update_search_vectors(touched)
+            with self.phase('catalog') as entry:
+                entry['rows'] += len(touched)
+                entry['updated'] += refresh_catalog_entries(touched)
+            bump_catalog_revision(shop.id)
+            # Каталог теперь собран из этого прайс-листа: сохраненные хэши и заголовки других источников магазина
+            # больше не описывают его, и их повторный импорт не должен пропускаться как неизменившийся.
+            # Состояние текущего источника записывает save_feed_state после импорта
+            ShopFeed.objects.filter(shop_id=shop.id).update(etag='', last_modified='', content_hash='')
+            # Снимок версии снимается в той же транзакции: в нем ровно каталог этого импорта,
+            # обновления остатков, зафиксированные после импорта, в него не попадают
+            if self.job is not None:
+                with self.phase('snapshot'):
+                    save_catalog_version(self.job, shop, changed)
+
+        # Фасеты пересчитываются после фиксации импорта отдельной транзакцией, ошибка пересчета импорт
+        # не отменяет. Связи магазина с категориями не удаляются, поэтому сюда входят и категории прежнего каталога
+        try:
+            with self.phase('facets') as entry:
+                entry['rows'] += refresh_facets(shop.categories.values_list('id', flat=True))
+        except Exception as e:
+            self.errors.append(f'Не удалось пересчитать фасеты: {e}')
+        return shop
+
+    def prepare(self, shop):
+        """
+        Подготовка к загрузке товаров: удаление предложений или загрузка текущих для сравнения
+        """
+        if self.mode == MODE_REPLACE:
+            self.delete_offers(shop)
+        else:
+            self.load_existing(shop)
+
+    def finish(self, shop):
+        """
+        Завершение импорта после загрузки всех товаров
+        """
+        if self.mode == MODE_DIFF:
+            self.retire_missing()
+
+    def delete_offers(self, shop):
+        """
+        Удаление всех предыдущих предложений товаров магазина перед новым импортом
+        """
+        with self.phase('delete') as entry:
+            deleted, per_model = ProductInfo.objects.filter(shop_id=shop.id).delete()
+            entry['rows'] += per_model.get(ProductInfo._meta.label, 0)
+            entry['deleted'] += deleted
+
+    def read_goods(self, goods):
+        """
+        Чтение товаров пачками. Для потокового прайс-листа здесь же идет разбор документа
+        """
+        chunks = chunked(goods, self.batch_size)
+        while True:
+            with self.phase('parse') as entry:
+                items = next(chunks, None)
+                entry['rows'] += len(items or ())
+            if items is None:
+                return
+            yield items
+
+    def import_shop(self, name):
+        with self.phase('shop') as entry:
+            shop, _ = Shop.objects.get_or_create(name=name, user_id=self.user_id)
+            entry['rows'] += 1
+        return shop
+
+    def import_categories(self, shop, categories):
+        """
+        Создание недостающих категорий и привязка их к магазину
+        """
+        with self.phase('categories') as entry:
+            names = {int(category['id']): category['name'] for category in categories}
+            # Категории общие для всех магазинов: недостающие фиксируются сразу, как продукты и параметры
+            entry['inserted'] += insert_missing(Category, ('id', 'name'), names.items(), batch_size=self.batch_size)
+            through = Category.shops.through
+            through.objects.bulk_create(
+                [through(category_id=category_id, shop_id=shop.id) for category_id in names],
+                batch_size=self.batch_size,
+                ignore_conflicts=True
+            )
+            entry['rows'] += len(names)
+
+    def load_existing(self, shop):
+        """
+        Загрузка текущих предложений магазина для сравнения с прайсом
+        """
+        with self.phase('existing') as entry:
+            rows = ProductInfo.objects.filter(shop_id=shop.id).order_by('id').values_list(
+                'external_id', 'id', *PRODUCT_INFO_FIELDS)
+            for external_id, *row in rows.iterator(chunk_size=self.batch_size):
+                if external_id in self._existing:
+                    self._stale.append(row[0])
+                else:
+                    self._existing[external_id] = tuple(row)
+                entry['rows'] += 1
+
+    def import_goods(self, shop, items):
+        """
+        Импорт пачки товаров. В режиме diff при повторе external_id в прайсе берется первый товар
+        """
+        self.resolve_products(items)
+        self.resolve_parameters(items)
+
+        new_items = []
+        matched = []
+        for item in items:
+            external_id = int(item['id'])
+            if self.mode == MODE_DIFF:
+                if external_id in self._seen:
+                    continue
+                self._seen.add(external_id)
+            if external_id in self._existing:
+                matched.append((item, self._existing[external_id]))
+            else:
+                new_items.append(item)
+
+        changed_parameters = self.update_matched(matched)
+
+        with self.phase('product_infos') as entry:
+            product_infos = ProductInfo.objects.bulk_create([
+                ProductInfo(shop_id=shop.id, external_id=item['id'], **self.item_fields(item))
+                for item in new_items
+            ])
+            entry['rows'] += len(product_infos)
+            entry['inserted'] += len(product_infos)
+            self._touched.update(product_info.id for product_info in product_infos)
+
+        with self.phase('product_parameters') as entry:
+            if changed_parameters:
+                entry['deleted'] += ProductParameter.objects.filter(
+                    product_info_id__in=[product_info_id for _, product_info_id in changed_parameters]).delete()[0]
+            product_parameters = ProductParameter.objects.bulk_create([
+                ProductParameter(product_info_id=product_info_id,
+                                 parameter_id=self._parameters[name],
+                                 value=value)
+                for item, product_info_id in changed_parameters + [
+                    (item, product_info.id) for item, product_info in zip(new_items, product_infos)]
+                for name, value in self.item_parameters(item).items()
+            ], batch_size=self.batch_size)
+            entry['rows'] += len(product_parameters)
+            entry['inserted'] += len(product_parameters)
+
+    def update_matched(self, matched):
+        """
+        Обновление изменившихся предложений пачки.
+        Возвращает пары (товар, ИД предложения), у которых нужно переписать параметры
+        """
+        if not matched:
+            return []
+
+        with self.phase('product_infos_update') as entry:
+            current_parameters = {}
+            rows = ProductParameter.objects.filter(
+                product_info_id__in=[row[0] for _, row in matched]
+            ).values_list('product_info_id', 'parameter_id', 'value')
+            for product_info_id, parameter_id, value in rows:
+                current_parameters.setdefault(product_info_id, {})[parameter_id] = value
+
+            changed = []
+            changed_parameters = []
+            for item, (product_info_id, *current) in matched:
+                fields = self.item_fields(item)
+                if tuple(fields[name] for name in PRODUCT_INFO_FIELDS) != tuple(current):
+                    changed.append(ProductInfo(id=product_info_id, **fields))
+
+                parameters = {self._parameters[name]: value for name, value in self.item_parameters(item).items()}
+                if parameters != current_parameters.get(product_info_id, {}):
+                    changed_parameters.append((item, product_info_id))
+
+            ProductInfo.objects.bulk_update(changed, PRODUCT_INFO_FIELDS, batch_size=self.batch_size)
+            entry['rows'] += len(changed)
+            entry['updated'] += len(changed)
+            self._touched.update(product_info.id for product_info in changed)
+            self._touched.update(product_info_id for _, product_info_id in changed_parameters)
+        return changed_parameters
+
+    def retire_missing(self):
+        """
+        Снятие с продажи предложений, которых нет в новом прайсе.
+        Предложения без заказов удаляются, на которые ссылаются корзины и заказы - обнуляются по остатку
+        """
+        missing = [row[0] for external_id, row in self._existing.items() if external_id not in self._seen]
+        self.retire(missing + self._stale)
+
+    def retire(self, product_info_ids):
+        """
+        Удаление предложений по ИД, кроме тех, на которые ссылаются корзины и заказы - они обнуляются по остатку
+        """
+        with self.phase('retire') as entry:
+            for ids in chunked(product_info_ids, self.batch_size):
+                ordered = set(OrderItem.objects.filter(product_info_id__in=ids).values_list(
+                    'product_info_id', flat=True).distinct())
+                entry['deleted'] += ProductInfo.objects.filter(
+                    id__in=[pk for pk in ids if pk not in ordered]).delete()[0]
+                entry['updated'] += ProductInfo.objects.filter(
+                    id__in=ordered).exclude(quantity=0).update(quantity=0)
+                entry['rows'] += len(ids)
+                self._touched.update(ordered)
+
+    def resolve_products(self, items):
+        """
+        Поиск и создание продуктов пачки одним запросом INSERT ... ON CONFLICT
+        """
+        with self.phase('products') as entry:
+            keys = {self.product_key(item) for item in items} - self._products.keys()
+            if not keys:
+                return
+            found, inserted = upsert_ids(Product, ('name', 'category'), keys, batch_size=self.batch_size)
+            self._products.update(found)
+            entry['rows'] += len(keys)
+            entry['inserted'] += inserted
+
+    def resolve_parameters(self, items):
+        """
+        Поиск и создание имен параметров пачки одним запросом INSERT ... ON CONFLICT
+        """
+        with self.phase('parameters') as entry:
+            names = {name for item in items for name in self.item_parameters(item)} - self._parameters.keys()
+            if not names:
+                return
+            found, inserted = upsert_ids(Parameter, ('name',), [(name,) for name in names], batch_size=self.batch_size)
+            self._parameters.update({name: parameter_id for (name,), parameter_id in found.items()})
+            entry['rows'] += len(names)
+            entry['inserted'] += inserted
+
+    def item_fields(self, item):
+        """
+        Значения полей предложения в том виде, в котором они хранятся в ProductInfo
+        """
+        return {
+            'product_id': self._products[self.product_key(item)],
+            'model': str(item['model']),
+            'price': self.to_price(item['price']),
+            'price_rrc': self.to_price(item['price_rrc']),
+            'quantity': int(item['quantity']),
+        }
+
+    @staticmethod
+    def to_price(value):
+        return Decimal(str(value)).quantize(Decimal('0.01'))
+
+    @staticmethod
+    def product_key(item):
+        return str(item['name']), int(item['category'])
+
+    @staticmethod
+    def item_parameters(item):
+        """
+        Параметры товара со значениями, приведенными к строке, как их хранит ProductParameter
+        """
+        return {str(name): str(value) for name, value in (item.get('parameters') or {}).items()}
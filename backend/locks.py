@@ -0,0 +1,46 @@
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+# Первый ключ рекомендательных блокировок импорта, второй - ИД пользователя-магазина
+IMPORT_LOCK_NAMESPACE = 1001
+
+# Первый ключ рекомендательных блокировок пересчета фасетов, второй - ИД категории
+FACET_LOCK_NAMESPACE = 1002
+
+
+@contextmanager
+def import_lock(user_id):
+    """
+    Рекомендательная блокировка PostgreSQL на импорт каталога магазина пользователя.
+    Не ждет: возвращает True, если блокировка получена, и False, если идет другой импорт магазина.
+    Блокировка сессионная и снимается при выходе, а если процесс упал - при закрытии соединения
+    """
+    if connection.vendor != 'postgresql':
+        yield True
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', [IMPORT_LOCK_NAMESPACE, user_id])
+        acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s, %s)', [IMPORT_LOCK_NAMESPACE, user_id])
+
+
+def lock_category_facets(category_ids):
+    """
+    Транзакционные рекомендательные блокировки PostgreSQL на пересчет фасетов категорий, по порядку ИД.
+    В отличие от FOR UPDATE на строках категорий, не конфликтуют с FOR KEY SHARE, которые берут
+    проверки внешних ключей параллельных импортов
+    """
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        for category_id in sorted(category_ids):
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [FACET_LOCK_NAMESPACE, category_id])
@@ -0,0 +1,149 @@
+import copy
+import csv
+import io
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from backend.feeds import FEED_FORMATS, CSV_COLUMNS
+
+
+class Command(BaseCommand):
+    """
+    Сравнение потокового разбора прайс-листа в разных форматах с загрузкой YAML целиком.
+    Прайс-лист строится из data/shop1.yaml размножением товаров до заданного количества
+    """
+    help = 'Бенчмарк разбора прайс-листа: время и пиковая память'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--goods', type=int, default=100000, help='Количество товаров в прайс-листе')
+        parser.add_argument('--source', default=os.path.join(settings.BASE_DIR, 'data', 'shop1.yaml'),
+                            help='Исходный прайс-лист')
+        parser.add_argument('--formats', default=','.join(FEED_FORMATS),
+                            help='Форматы через запятую: ' + ', '.join(FEED_FORMATS))
+        parser.add_argument('--skip-full', action='store_true',
+                            help='Не замерять загрузку YAML целиком через yaml.Loader (долго на больших файлах)')
+
+    def handle(self, *args, **options):
+        with open(options['source'], encoding='utf-8') as file:
+            source = yaml.safe_load(file)
+        self.stdout.write(f'libyaml: {"да" if yaml.__with_libyaml__ else "нет"}')
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name in options['formats'].split(','):
+                path = os.path.join(directory, f'feed.{name}')
+                with open(path, 'w', encoding='utf-8', newline='') as file:
+                    getattr(self, f'write_{name}')(file, source, self.scaled_goods(source, options['goods']))
+                self.stdout.write(f'{name}: {options["goods"]} товаров, {os.path.getsize(path) / 2 ** 20:.1f} МБ')
+
+                if name == 'yaml' and not options['skip_full']:
+                    self.measure('  yaml.load (Loader)', load_full, path)
+                if name == 'zip':
+                    self.measure('  разбор архива в одном процессе', load_archive, path, 1)
+                self.measure('  потоковый разбор', load_stream, path, name)
+
+    @staticmethod
+    def scaled_goods(source, count):
+        """
+        count товаров, полученных копированием товаров источника с новыми ИД
+        """
+        goods = source['goods']
+        for number in range(count):
+            item = copy.deepcopy(goods[number % len(goods)])
+            item['id'] = number + 1
+            yield item
+
+    @staticmethod
+    def write_yaml(file, source, goods):
+        dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+        yaml.dump({'shop': source['shop'], 'categories': source['categories']}, file,
+                  Dumper=dumper, allow_unicode=True, sort_keys=False)
+        file.write('goods:\n')
+        for item in goods:
+            text = yaml.dump([item], Dumper=dumper, allow_unicode=True, sort_keys=False)
+            file.write(''.join(f'  {line}\n' for line in text.splitlines()))
+
+    @staticmethod
+    def write_json(file, source, goods):
+        file.write(json.dumps({'shop': source['shop'], 'categories': source['categories']},
+                              ensure_ascii=False)[:-1])
+        file.write(', "goods": [')
+        for number, item in enumerate(goods):
+            file.write((', ' if number else '') + json.dumps(item, ensure_ascii=False))
+        file.write(']}')
+
+    @staticmethod
+    def write_ndjson(file, source, goods):
+        file.write(json.dumps({'shop': source['shop'], 'categories': source['categories']},
+                              ensure_ascii=False) + '\n')
+        for item in goods:
+            file.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+    @staticmethod
+    def write_csv(file, source, goods):
+        categories = {category['id']: category['name'] for category in source['categories']}
+        parameters = sorted({name for item in source['goods'] for name in item['parameters']})
+        writer = csv.writer(file)
+        writer.writerow(CSV_COLUMNS + tuple(parameters))
+        for item in goods:
+            writer.writerow([source['shop'], item['id'], item['category'], categories[item['category']]] +
+                            [item[column] for column in CSV_COLUMNS[4:]] +
+                            [item['parameters'].get(name, '') for name in parameters])
+
+    @classmethod
+    def write_zip(cls, file, source, goods):
+        """
+        Архив с YAML-файлом на каждую категорию
+        """
+        categories = defaultdict(list)
+        for item in goods:
+            categories[item['category']].append(item)
+        with zipfile.ZipFile(file.buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for category, items in categories.items():
+                with archive.open(f'category{category}.yaml', 'w') as member, \
+                        io.TextIOWrapper(member, encoding='utf-8') as text:
+                    cls.write_yaml(text, source, items)
+
+    def measure(self, title, loader, *args):
+        """
+        Замер в отдельном процессе: время и прирост пикового RSS относительно старта процесса
+        """
+        # Процесс замера не демонический: разбор архива сам запускает пул процессов
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('fork')) as executor:
+            count, seconds, peak = executor.submit(run_measured, loader, *args).result()
+        self.stdout.write(f'{title}: {count} товаров, {seconds:.2f} с, прирост пиковой памяти {peak / 1024:.1f} МБ')
+
+
+def run_measured(loader, *args):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.monotonic()
+    count = loader(*args)
+    seconds = time.monotonic() - started
+    return count, seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+
+
+def load_full(path):
+    with open(path, 'rb') as file:
+        data = yaml.load(file.read(), Loader=yaml.Loader)
+    return len(data['goods'])
+
+
+def load_stream(path, name):
+    with open(path, 'rb') as file:
+        return sum(1 for _ in FEED_FORMATS[name]['parser'](file)['goods'])
+
+
+def load_archive(path, workers):
+    # Процесс замера отдельный, настройка меняется только в нем
+    settings.FEED_ARCHIVE_WORKERS = workers
+    return load_stream(path, 'zip')
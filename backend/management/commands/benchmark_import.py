@@ -0,0 +1,64 @@
+import os
+import time
+import uuid
+
+import yaml
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from backend.copy_importer import CopyCatalogImporter
+from backend.importer import CatalogImporter, IMPORT_MODES, MODE_DIFF
+from backend.management.commands.benchmark_feed import Command as FeedBenchmark
+from backend.models import User
+
+
+IMPORTERS = {
+    'orm': CatalogImporter,
+    'copy': CopyCatalogImporter,
+}
+
+
+class Command(BaseCommand):
+    """
+    Сравнение импорта каталога через ORM и через COPY в промежуточные таблицы.
+    Для каждого способа выполняется первичная загрузка, повторная без изменений и с изменением
+    цен части товаров. Все изменения в БД откатываются после замера
+    """
+    help = 'Бенчмарк импорта каталога: ORM и COPY через промежуточные таблицы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--goods', type=int, default=100000, help='Количество товаров в прайс-листе')
+        parser.add_argument('--source', default=os.path.join(settings.BASE_DIR, 'data', 'shop1.yaml'),
+                            help='Исходный прайс-лист')
+        parser.add_argument('--methods', default=','.join(IMPORTERS),
+                            help='Способы импорта через запятую: ' + ', '.join(IMPORTERS))
+        parser.add_argument('--mode', choices=IMPORT_MODES, default=MODE_DIFF, help='Режим импорта')
+        parser.add_argument('--changed', type=float, default=0.1,
+                            help='Доля товаров с измененной ценой в третьем прогоне')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Импорт через COPY доступен только на PostgreSQL')
+
+        with open(options['source'], encoding='utf-8') as file:
+            source = yaml.safe_load(file)
+        goods = list(FeedBenchmark.scaled_goods(source, options['goods']))
+        step = max(1, round(1 / options['changed'])) if options['changed'] else 0
+        changed = [dict(item, price=item['price'] + 1) if step and number % step == 0 else item
+                   for number, item in enumerate(goods)]
+        runs = (('первичная загрузка', goods), ('без изменений', goods), ('изменены цены', changed))
+
+        for method in options['methods'].split(','):
+            with transaction.atomic():
+                user = User.objects.create(email=f'benchmark-{uuid.uuid4().hex}@example.com',
+                                           username=uuid.uuid4().hex, type='shop')
+                for title, feed in runs:
+                    importer = IMPORTERS[method](user.id, mode=options['mode'])
+                    started = time.monotonic()
+                    importer.run({'shop': source['shop'], 'categories': source['categories'], 'goods': iter(feed)})
+                    seconds = time.monotonic() - started
+                    self.stdout.write(f'{method}, {title}: {len(feed)} товаров, {seconds:.2f} с')
+                    for phase, entry in sorted(importer.stats.items(), key=lambda pair: -pair[1]['seconds']):
+                        self.stdout.write(f'  {phase}: {entry["seconds"]:.2f} с, строк {entry["rows"]}')
+                transaction.set_rollback(True)
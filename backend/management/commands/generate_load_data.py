@@ -0,0 +1,349 @@
+import glob
+import io
+import os
+import random
+import time
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+import yaml
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from backend.catalog import refresh_catalog_entries
+from backend.copy_importer import copy_value
+from backend.facets import refresh_facets
+from backend.search import update_search_vectors
+from backend.models import (
+    STATE_CHOICES, User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Contact, Order,
+    OrderItem,
+)
+
+
+# Строк в одной пачке записи
+GENERATE_BATCH_SIZE = 5000
+
+# Доли заказов истории по статусам
+ORDER_STATE_WEIGHTS = {
+    'new': 4,
+    'confirmed': 5,
+    'assembled': 3,
+    'sent': 8,
+    'delivered': 70,
+    'canceled': 10,
+}
+
+# Доля покупателей с непустой корзиной, корзина у покупателя одна
+BASKET_SHARE = 0.2
+
+# Количество товара в позиции заказа и его вероятность
+ITEM_QUANTITY_WEIGHTS = {1: 70, 2: 20, 3: 7, 5: 3}
+
+# Доля предложений, которых нет в наличии
+OUT_OF_STOCK_SHARE = 0.1
+
+CITIES = ('Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург', 'Казань', 'Нижний Новгород',
+          'Челябинск', 'Самара', 'Омск', 'Ростов-на-Дону', 'Уфа', 'Красноярск', 'Воронеж', 'Пермь')
+STREETS = ('Ленина', 'Мира', 'Советская', 'Садовая', 'Гагарина', 'Лесная', 'Школьная', 'Молодежная',
+           'Центральная', 'Набережная', 'Пушкина', 'Заводская')
+
+
+@contextmanager
+def explicit_timestamps(model):
+    """
+    Запись полей auto_now/auto_now_add модели как есть: иначе bulk_create подставит текущее время
+    """
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    """
+    Генерация каталога, покупателей и истории заказов для нагрузочного тестирования.
+    Товары строятся по образцу прайс-листов data/shop*.yaml: категории, названия, цены и значения
+    параметров берутся из распределений по категориям исходных прайсов. При одном и том же --seed
+    генерируются одинаковые данные. Строки пишутся пачками bulk_create, строки без ссылок на них
+    (параметры предложений, позиции заказов) в PostgreSQL - через COPY
+    """
+    help = 'Генерация магазинов, товаров, покупателей и заказов для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shops', type=int, default=10, help='Количество магазинов')
+        parser.add_argument('--products', type=int, default=10000, help='Количество продуктов')
+        parser.add_argument('--offers-per-product', type=int, default=3,
+                            help='Наибольшее число магазинов, продающих один продукт')
+        parser.add_argument('--buyers', type=int, default=1000, help='Количество покупателей')
+        parser.add_argument('--orders', type=int, default=10000, help='Количество заказов в истории')
+        parser.add_argument('--items-per-order', type=int, default=5, help='Наибольшее число позиций в заказе')
+        parser.add_argument('--days', type=int, default=365, help='Глубина истории заказов, дней')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора случайных чисел')
+        parser.add_argument('--password', default='load-test', help='Пароль всех созданных пользователей')
+        parser.add_argument('--batch-size', type=int, default=GENERATE_BATCH_SIZE, help='Строк в одной пачке')
+        parser.add_argument('--source', default=os.path.join(settings.BASE_DIR, 'data'),
+                            help='Каталог с исходными прайс-листами YAML')
+
+    def handle(self, *args, **options):
+        if min(options['shops'], options['buyers'], options['offers_per_product'], options['items_per_order']) < 1:
+            raise CommandError('Нужен хотя бы один магазин и покупатель, предложение и позиция заказа')
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = f'load{options["seed"]}'
+        if User.objects.filter(email__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f'Данные с --seed {options["seed"]} уже сгенерированы, укажите другой')
+
+        templates = self.load_templates(options['source'])
+        password = make_password(options['password'])
+        started = time.monotonic()
+        with transaction.atomic():
+            shop_ids = self.stage('магазины', self.generate_shops, options['shops'], password)
+            offer_ids = self.stage('товары', self.generate_catalog, templates, shop_ids, options['products'],
+                                   options['offers_per_product'])
+            contacts = self.stage('покупатели', self.generate_buyers, options['buyers'], password)
+            self.stage('заказы', self.generate_orders, contacts, offer_ids, options['orders'],
+                       options['items_per_order'], options['days'])
+            self.stage('фасеты', self.generate_facets, templates)
+            self.stage('поиск', self.generate_search_vectors, offer_ids)
+            self.stage('каталог для выдачи', self.generate_catalog_entries, offer_ids)
+
+        if connection.vendor == 'postgresql':
+            # Статистика планировщика сразу по сгенерированным данным, не дожидаясь автоочистки
+            with connection.cursor() as cursor:
+                for model in (Product, ProductInfo, ProductParameter, Contact, Order, OrderItem):
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+        self.stdout.write(f'Всего: {time.monotonic() - started:.1f} с')
+
+    def stage(self, title, generate, *args):
+        """
+        Этап генерации с выводом числа созданных строк и длительности
+        """
+        started = time.monotonic()
+        self.rows = 0
+        result = generate(*args)
+        self.stdout.write(f'{title}: {self.rows} строк, {time.monotonic() - started:.1f} с')
+        return result
+
+    @staticmethod
+    def load_templates(directory):
+        """
+        Образцы товаров по названиям категорий: ИД категории в исходных прайсах, их товары и все
+        встреченные значения каждого параметра (с повторами, чтобы сохранить частоты)
+        """
+        templates = {}
+        for path in sorted(glob.glob(os.path.join(directory, '*.yaml'))):
+            with open(path, encoding='utf-8') as file:
+                data = yaml.safe_load(file)
+            names = {category['id']: category['name'] for category in data['categories']}
+            for item in data['goods']:
+                template = templates.setdefault(names[item['category']], {
+                    'category_id': int(item['category']), 'goods': [], 'values': defaultdict(list)})
+                template['goods'].append(item)
+                for name, value in (item.get('parameters') or {}).items():
+                    template['values'][str(name)].append(str(value))
+        if not templates:
+            raise CommandError(f'В каталоге {directory} нет прайс-листов YAML')
+        return templates
+
+    def create(self, model, objects):
+        """
+        Запись объектов пачками с получением их ИД
+        """
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        self.rows += len(objects)
+        return [obj.id for obj in objects]
+
+    def write_rows(self, model, fields, rows):
+        """
+        Запись строк без получения ИД: в PostgreSQL одной командой COPY, в остальных БД через bulk_create
+        """
+        self.rows += len(rows)
+        if connection.vendor != 'postgresql':
+            model.objects.bulk_create([model(**dict(zip(fields, row))) for row in rows], batch_size=self.batch_size)
+            return
+
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(map(copy_value, row)) + '\n')
+        buffer.seek(0)
+        columns = ', '.join(connection.ops.quote_name(model._meta.get_field(field).column) for field in fields)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f'COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN',
+                               buffer)
+
+    def create_users(self, kind, count, password):
+        """
+        Активные пользователи заданного типа, почта вида load<seed>-<kind><номер>@example.com
+        """
+        ids = []
+        for start in range(0, count, self.batch_size):
+            ids += self.create(User, [
+                User(email=f'{self.prefix}-{kind}{number}@example.com', username=f'{self.prefix}-{kind}{number}',
+                     password=password, type=kind, is_active=True)
+                for number in range(start + 1, min(start + self.batch_size, count) + 1)
+            ])
+        return ids
+
+    def generate_shops(self, count, password):
+        user_ids = self.create_users('shop', count, password)
+        return self.create(Shop, [Shop(name=f'Магазин {self.prefix}-{number}', user_id=user_id)
+                                  for number, user_id in enumerate(user_ids, 1)])
+
+    def generate_catalog(self, templates, shop_ids, count, offers_per_product):
+        """
+        Продукты, их предложения в 1..offers_per_product магазинах и параметры предложений.
+        Возвращает ИД всех предложений
+        """
+        # ИД категорий как в исходных прайсах: импорт этих прайсов после генерации ссылается на те же категории
+        Category.objects.bulk_create([Category(id=template['category_id'], name=name)
+                                      for name, template in templates.items()], ignore_conflicts=True)
+        category_ids = dict(Category.objects.filter(name__in=templates).values_list('name', 'id'))
+        parameter_names = sorted({name for template in templates.values() for name in template['values']})
+        Parameter.objects.bulk_create([Parameter(name=name) for name in parameter_names], ignore_conflicts=True)
+        parameter_ids = dict(Parameter.objects.filter(name__in=parameter_names).values_list('name', 'id'))
+
+        # Категории встречаются так же часто, как в исходных прайсах
+        names = list(templates)
+        weights = [len(templates[name]['goods']) for name in names]
+        external_ids = dict.fromkeys(shop_ids, 0)
+        shop_categories = set()
+        offer_ids = array('q')
+
+        for start in range(0, count, self.batch_size):
+            products = []
+            for number in range(start + 1, min(start + self.batch_size, count) + 1):
+                name = self.random.choices(names, weights)[0]
+                template = templates[name]
+                item = self.random.choice(template['goods'])
+                parameters = {parameter: self.random.choice(template['values'][str(parameter)])
+                              for parameter in item.get('parameters') or {}}
+                products.append((
+                    Product(name=f'{item["name"][:64]} {self.prefix}-{number}', category_id=category_ids[name]),
+                    item, parameters,
+                ))
+            self.create(Product, [product for product, _, _ in products])
+
+            offers = []
+            for product, item, parameters in products:
+                sellers = self.random.randint(1, min(offers_per_product, len(shop_ids)))
+                for shop_id in self.random.sample(shop_ids, sellers):
+                    external_ids[shop_id] += 1
+                    shop_categories.add((shop_id, product.category_id))
+                    offers.append((ProductInfo(
+                        product_id=product.id, shop_id=shop_id, external_id=external_ids[shop_id],
+                        model=item.get('model', '')[:80], quantity=self.quantity(), **self.prices(item),
+                    ), parameters))
+            offer_ids.extend(self.create(ProductInfo, [offer for offer, _ in offers]))
+
+            self.write_rows(ProductParameter, ('product_info_id', 'parameter_id', 'value'), [
+                (offer.id, parameter_ids[str(name)], value[:100])
+                for offer, parameters in offers for name, value in parameters.items()
+            ])
+
+        Category.shops.through.objects.bulk_create(
+            [Category.shops.through(shop_id=shop_id, category_id=category_id)
+             for shop_id, category_id in shop_categories],
+            batch_size=self.batch_size, ignore_conflicts=True)
+        return offer_ids
+
+    def generate_facets(self, templates):
+        """
+        Пересчет фасетов категорий по сгенерированным предложениям
+        """
+        self.rows += refresh_facets(Category.objects.filter(name__in=templates).values_list('id', flat=True))
+
+    def generate_search_vectors(self, offer_ids):
+        """
+        Поисковые векторы сгенерированных предложений (только PostgreSQL)
+        """
+        self.rows += update_search_vectors(offer_ids)
+
+    def generate_catalog_entries(self, offer_ids):
+        """
+        Записи каталога для выдачи по сгенерированным предложениям
+        """
+        self.rows += refresh_catalog_entries(offer_ids)
+
+    def prices(self, item):
+        """
+        Цена образца с разбросом ±20% и рекомендуемая цена на 3-15% выше
+        """
+        price = round(float(item['price']) * self.random.uniform(0.8, 1.2), -1)
+        price_rrc = round(price * self.random.uniform(1.03, 1.15), -1)
+        return {'price': Decimal(f'{price:.2f}'), 'price_rrc': Decimal(f'{price_rrc:.2f}')}
+
+    def quantity(self):
+        if self.random.random() < OUT_OF_STOCK_SHARE:
+            return 0
+        return int(self.random.expovariate(1 / 20)) + 1
+
+    def generate_buyers(self, count, password):
+        """
+        Покупатели с одним-двумя адресами доставки. Возвращает ИД покупателей и их адресов
+        """
+        user_ids = self.create_users('buyer', count, password)
+        contacts = {}
+        for start in range(0, count, self.batch_size):
+            objects = []
+            for user_id in user_ids[start:start + self.batch_size]:
+                for _ in range(self.random.choice((1, 1, 1, 2))):
+                    objects.append(Contact(
+                        user_id=user_id, city=self.random.choice(CITIES), street=self.random.choice(STREETS),
+                        house=str(self.random.randint(1, 150)), apartment=str(self.random.randint(1, 300)),
+                        phone=f'+79{self.random.randrange(10 ** 9):09d}',
+                    ))
+            self.create(Contact, objects)
+            for contact in objects:
+                contacts.setdefault(contact.user_id, []).append(contact.id)
+        return contacts
+
+    def generate_orders(self, contacts, offer_ids, count, items_per_order, days):
+        """
+        Корзины части покупателей и история заказов во всех остальных статусах за последние days дней.
+        Популярность предложений неравномерна: малая доля предложений собирает большую часть позиций
+        """
+        if not offer_ids:
+            return
+        buyer_ids = list(contacts)
+        states = [state for state, _ in STATE_CHOICES if state in ORDER_STATE_WEIGHTS]
+        weights = [ORDER_STATE_WEIGHTS[state] for state in states]
+        quantities = list(ITEM_QUANTITY_WEIGHTS)
+        quantity_weights = list(ITEM_QUANTITY_WEIGHTS.values())
+        now = timezone.now()
+
+        baskets = self.random.sample(buyer_ids, int(len(buyer_ids) * BASKET_SHARE))
+        total = len(baskets) + count
+        for start in range(0, total, self.batch_size):
+            orders = []
+            for number in range(start, min(start + self.batch_size, total)):
+                if number < len(baskets):
+                    dt = now - timedelta(seconds=self.random.uniform(0, 7 * 24 * 3600))
+                    orders.append(Order(user_id=baskets[number], state='basket', dt=dt, updated_at=dt))
+                    continue
+                user_id = self.random.choice(buyer_ids)
+                dt = now - timedelta(seconds=self.random.uniform(0, days * 24 * 3600))
+                updated_at = min(now, dt + timedelta(hours=self.random.uniform(0, 72)))
+                orders.append(Order(user_id=user_id, state=self.random.choices(states, weights)[0], dt=dt,
+                                    updated_at=updated_at, contact_id=self.random.choice(contacts[user_id])))
+            with explicit_timestamps(Order):
+                self.create(Order, orders)
+
+            items = []
+            for order in orders:
+                positions = {int(len(offer_ids) * self.random.random() ** 3)
+                             for _ in range(self.random.randint(1, items_per_order))}
+                items += [(order.id, offer_ids[position], self.random.choices(quantities, quantity_weights)[0])
+                          for position in positions]
+            self.write_rows(OrderItem, ('order_id', 'product_info_id', 'quantity'), items)
@@ -0,0 +1,68 @@
+import os
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.feeds import FEED_FORMATS, open_feed
+from backend.importer import IMPORT_MODES, MODE_DIFF, get_importer_class
+from backend.locks import import_lock
+from backend.models import User
+
+
+class Command(BaseCommand):
+    """
+    Импорт прайс-листа из локального файла или всех прайс-листов каталога,
+    например data/shop*.yaml. Используется тот же потоковый разбор и импорт, что и в partner/update
+    """
+    help = 'Импорт прайс-листов из локального файла или каталога'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл прайс-листа или каталог с прайс-листами')
+        parser.add_argument('--user', help='Email пользователя-магазина, к которому привязать магазин. '
+                                           'Без него магазины создаются без пользователя')
+        parser.add_argument('--mode', choices=IMPORT_MODES, default=MODE_DIFF, help='Режим импорта')
+
+    def handle(self, *args, **options):
+        paths = self.feed_paths(options['path'])
+
+        user_id = None
+        if options['user']:
+            user = User.objects.filter(email=options['user']).first()
+            if not user:
+                raise CommandError(f'Пользователь {options["user"]} не найден')
+            if len(paths) > 1:
+                raise CommandError('К одному пользователю привязывается только один магазин, укажите файл')
+            user_id = user.id
+
+        for path in paths:
+            started = time.monotonic()
+            # Как и задачи импорта, под блокировкой магазина: параллельно с импортом из очереди не запускается.
+            # Магазины без пользователя очередь не импортирует
+            with import_lock(user_id) if user_id else nullcontext(True) as acquired:
+                if not acquired:
+                    raise CommandError('Идет другой импорт магазина пользователя, повторите позже')
+                with open_feed(path) as feed:
+                    importer = get_importer_class(user_id)(user_id, mode=options['mode'])
+                    shop = importer.run(feed.parse())
+            self.stdout.write(f'{path}: магазин «{shop.name}», {importer.processed} товаров, '
+                              f'{time.monotonic() - started:.2f} с')
+            for error in importer.errors:
+                self.stderr.write(f'{path}: {error}')
+
+    @staticmethod
+    def feed_paths(path):
+        """
+        Файлы для импорта: сам файл или прайс-листы известных форматов в каталоге
+        """
+        if os.path.isfile(path):
+            return [path]
+        if not os.path.isdir(path):
+            raise CommandError(f'Файл или каталог {path} не найден')
+
+        extensions = {extension for feed in FEED_FORMATS.values() for extension in feed['extensions']}
+        paths = sorted(os.path.join(path, name) for name in os.listdir(path)
+                       if os.path.splitext(name)[1].lower() in extensions)
+        if not paths:
+            raise CommandError(f'В каталоге {path} нет прайс-листов')
+        return paths
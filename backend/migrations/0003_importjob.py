@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0002_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='contact',
+            options={'verbose_name': 'Контакты пользователя', 'verbose_name_plural': 'Список контактов пользователей'},
+        ),
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(verbose_name='Ссылка на прайс-лист')),
+                ('mode', models.CharField(default='diff', max_length=10, verbose_name='Режим импорта')),
+                ('state', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершен'), ('failed', 'Ошибка')], default='queued', max_length=10, verbose_name='Статус')),
+                ('task_id', models.CharField(blank=True, max_length=255, verbose_name='ИД задачи Celery')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Обработано товаров')),
+                ('total', models.PositiveIntegerField(blank=True, null=True, verbose_name='Всего товаров')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='Ошибки')),
+                ('stats', models.JSONField(blank=True, default=dict, verbose_name='Статистика по этапам')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('shop', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='import_jobs', to='backend.shop', verbose_name='Магазин')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задача импорта',
+                'verbose_name_plural': 'Список задач импорта',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0003_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='force',
+            field=models.BooleanField(default=False, verbose_name='Импорт без проверки изменений'),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='state',
+            field=models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершен'), ('skipped', 'Пропущен, прайс-лист не изменился'), ('failed', 'Ошибка')], default='queued', max_length=10, verbose_name='Статус'),
+        ),
+        migrations.CreateModel(
+            name='ShopFeed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(verbose_name='Ссылка на прайс-лист')),
+                ('etag', models.CharField(blank=True, max_length=255, verbose_name='ETag')),
+                ('last_modified', models.CharField(blank=True, max_length=64, verbose_name='Last-Modified')),
+                ('content_hash', models.CharField(blank=True, max_length=64, verbose_name='SHA-256 содержимого')),
+                ('checked_at', models.DateTimeField(blank=True, null=True, verbose_name='Последняя проверка')),
+                ('imported_at', models.DateTimeField(blank=True, null=True, verbose_name='Последний импорт')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feeds', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Прайс-лист магазина',
+                'verbose_name_plural': 'Список прайс-листов магазинов',
+                'constraints': [models.UniqueConstraint(fields=('shop', 'url'), name='unique_shop_feed')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_shopfeed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='refresh_interval',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Новый интервал автообновления (мин)'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='source',
+            field=models.CharField(choices=[('api', 'Запрос магазина'), ('schedule', 'Автообновление')], default='api', max_length=10, verbose_name='Источник запуска'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='next_refresh_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Следующее автообновление прайса'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='refresh_interval',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Интервал автообновления прайса (мин)'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_productinfo_shop_external'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='import_method',
+            field=models.CharField(choices=[('orm', 'ORM'), ('copy', 'COPY через промежуточную таблицу (PostgreSQL)')], default='orm', max_length=5, verbose_name='Способ импорта прайса'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_shop_import_method'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='file',
+            field=models.FileField(blank=True, upload_to='imports/%Y/%m/%d', verbose_name='Загруженный прайс-лист'),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='url',
+            field=models.URLField(blank=True, verbose_name='Ссылка на прайс-лист'),
+        ),
+        migrations.AlterField(
+            model_name='shopfeed',
+            name='url',
+            field=models.URLField(blank=True, verbose_name='Ссылка на прайс-лист'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:00
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Слияние дублей продуктов и имен параметров перед созданием уникальных ограничений:
+    ссылки переводятся на строку с меньшим ИД, остальные удаляются
+    """
+    Product = apps.get_model('backend', 'Product')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    Parameter = apps.get_model('backend', 'Parameter')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+
+    groups = Product.objects.values('name', 'category_id').annotate(
+        count=Count('id'), keep=Min('id')).filter(count__gt=1)
+    for group in groups:
+        duplicates = Product.objects.filter(name=group['name'], category_id=group['category_id']).exclude(
+            id=group['keep'])
+        ProductInfo.objects.filter(product__in=duplicates).update(product_id=group['keep'])
+        duplicates.delete()
+
+    groups = Parameter.objects.values('name').annotate(count=Count('id'), keep=Min('id')).filter(count__gt=1)
+    for group in groups:
+        duplicates = Parameter.objects.filter(name=group['name']).exclude(id=group['keep'])
+        # Если у предложения есть оба параметра, остается значение основного
+        ProductParameter.objects.filter(
+            parameter__in=duplicates,
+            product_info__product_parameters__parameter_id=group['keep']
+        ).delete()
+        ProductParameter.objects.filter(parameter__in=duplicates).update(parameter_id=group['keep'])
+        duplicates.delete()
+
+    # Внешние ключи проверяются отложенно: без немедленной проверки отложенные события триггеров
+    # не дают следующим операциям миграции выполнить ALTER TABLE этих таблиц
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_importjob_file'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='parameter',
+            constraint=models.UniqueConstraint(fields=('name',), name='unique_parameter'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('name', 'category'), name='unique_product'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_unique_product_parameter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='peak_memory',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Пик памяти (байт)'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='queries',
+            field=models.PositiveIntegerField(default=0, verbose_name='Запросов к БД'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='rows_deleted',
+            field=models.PositiveIntegerField(default=0, verbose_name='Удалено строк'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='rows_inserted',
+            field=models.PositiveIntegerField(default=0, verbose_name='Вставлено строк'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='rows_updated',
+            field=models.PositiveIntegerField(default=0, verbose_name='Обновлено строк'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_importjob_telemetry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importjob',
+            name='source',
+            field=models.CharField(choices=[('api', 'Запрос магазина'), ('schedule', 'Автообновление'), ('rollback', 'Откат каталога')], default='api', max_length=10, verbose_name='Источник запуска'),
+        ),
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(verbose_name='Номер версии')),
+                ('file', models.FileField(upload_to='catalog_versions/%Y/%m/%d', verbose_name='Снимок каталога')),
+                ('goods', models.PositiveIntegerField(default=0, verbose_name='Предложений')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='catalog_versions', to='backend.importjob', verbose_name='Задача импорта')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_versions', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Версия каталога',
+                'verbose_name_plural': 'Список версий каталога',
+                'ordering': ('-number',),
+            },
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='rollback_to',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rollback_jobs', to='backend.catalogversion', verbose_name='Откат к версии каталога'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='catalog_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='backend.catalogversion', verbose_name='Текущая версия каталога'),
+        ),
+        migrations.AddConstraint(
+            model_name='catalogversion',
+            constraint=models.UniqueConstraint(fields=('shop', 'number'), name='unique_catalog_version'),
+        ),
+    ]
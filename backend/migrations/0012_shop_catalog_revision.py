@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_catalog_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='catalog_revision',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Ревизия каталога'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0012_shop_catalog_revision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(default='yaml', max_length=10, verbose_name='Формат')),
+                ('compression', models.CharField(blank=True, max_length=10, verbose_name='Сжатие')),
+                ('catalog_revision', models.PositiveBigIntegerField(default=0, verbose_name='Ревизия каталога')),
+                ('state', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершен'), ('failed', 'Ошибка')], default='queued', max_length=10, verbose_name='Статус')),
+                ('task_id', models.CharField(blank=True, max_length=255, verbose_name='ИД задачи Celery')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Выгружено товаров')),
+                ('total', models.PositiveIntegerField(blank=True, null=True, verbose_name='Всего товаров')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='Ошибки')),
+                ('file', models.FileField(blank=True, upload_to='export_jobs/%Y/%m/%d', verbose_name='Файл выгрузки')),
+                ('size', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Размер файла (байт)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Файл хранится до')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to='backend.shop', verbose_name='Магазин')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задача выгрузки',
+                'verbose_name_plural': 'Список задач выгрузки',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
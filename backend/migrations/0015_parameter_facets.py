@@ -0,0 +1,76 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:17
+
+import math
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_facets(apps, schema_editor):
+    """
+    Начальный расчет фасетов по уже загруженным каталогам открытых магазинов
+    """
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    ParameterFacet = apps.get_model('backend', 'ParameterFacet')
+
+    def to_number(value):
+        try:
+            number = float(value.strip().replace(',', '.'))
+        except ValueError:
+            return None
+        return number if math.isfinite(number) else None
+
+    counts = ProductParameter.objects.filter(product_info__shop__state=True).values_list(
+        'product_info__product__category_id', 'parameter_id', 'value').annotate(offers=Count('id')).order_by()
+    ParameterFacet.objects.bulk_create(
+        [ParameterFacet(category_id=category_id, parameter_id=parameter_id, value=value,
+                        value_number=to_number(value), offers=offers)
+         for category_id, parameter_id, value, offers in counts],
+        batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0014_productinfo_shop_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=100, verbose_name='Значение')),
+                ('value_number', models.FloatField(blank=True, null=True, verbose_name='Числовое значение')),
+                ('offers', models.PositiveIntegerField(default=0, verbose_name='Предложений')),
+            ],
+            options={
+                'verbose_name': 'Фасет параметра',
+                'verbose_name_plural': 'Список фасетов параметров',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value', 'product_info'], name='product_parameter_value'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.category', verbose_name='Категория'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='parameter',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.parameter', verbose_name='Параметр'),
+        ),
+        migrations.AddIndex(
+            model_name='parameterfacet',
+            index=models.Index(fields=['parameter', 'value_number'], name='parameter_facet_number'),
+        ),
+        migrations.AddConstraint(
+            model_name='parameterfacet',
+            constraint=models.UniqueConstraint(fields=('category', 'parameter', 'value'), name='unique_parameter_facet'),
+        ),
+        migrations.RunPython(fill_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:20
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def fill_search_vectors(apps, schema_editor):
+    """
+    Поисковые векторы уже загруженных предложений, до создания индекса, чтобы не перестраивать его построчно
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("""
+        UPDATE backend_productinfo AS offer
+        SET search_vector = document.vector
+        FROM (
+            SELECT info.id,
+                   setweight(to_tsvector('russian', product.name), 'A')
+                   || setweight(to_tsvector('russian', info.model), 'B')
+                   || setweight(to_tsvector('russian',
+                                            coalesce(string_agg(parameter.value, ' ' ORDER BY parameter.id), '')), 'C')
+                   AS vector
+            FROM backend_productinfo AS info
+            JOIN backend_product AS product ON product.id = info.product_id
+            LEFT JOIN backend_productparameter AS parameter ON parameter.product_info_id = info.id
+            GROUP BY info.id, product.name
+        ) AS document
+        WHERE offer.id = document.id
+    """)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0015_parameter_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_info_search'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:23
+
+from itertools import islice
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Prefetch
+
+
+def fill_catalog_entries(apps, schema_editor):
+    """
+    Начальная сборка каталога для выдачи по всем предложениям, документы - в формате ответа GET products
+    """
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    CatalogEntry = apps.get_model('backend', 'CatalogEntry')
+
+    offers = ProductInfo.objects.select_related('product__category', 'shop').prefetch_related(
+        Prefetch('product_parameters', queryset=ProductParameter.objects.select_related('parameter').order_by('id'))
+    ).defer('search_vector').order_by('id').iterator(chunk_size=2000)
+    while True:
+        chunk = list(islice(offers, 2000))
+        if not chunk:
+            return
+        CatalogEntry.objects.bulk_create([
+            CatalogEntry(product_info_id=offer.id, shop_id=offer.shop_id, category_id=offer.product.category_id,
+                         price=offer.price, in_stock=offer.quantity > 0, shop_state=offer.shop.state, document={
+                             'id': offer.id,
+                             'model': offer.model,
+                             'product': {'name': offer.product.name, 'category': offer.product.category.name},
+                             'shop': offer.shop_id,
+                             'quantity': offer.quantity,
+                             'price': f'{offer.price:.2f}',
+                             'price_rrc': f'{offer.price_rrc:.2f}',
+                             'product_parameters': [
+                                 {'parameter': parameter.parameter.name, 'value': parameter.value}
+                                 for parameter in offer.product_parameters.all()],
+                         })
+            for offer in chunk
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0017_trigram_suggest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEntry',
+            fields=[
+                ('product_info', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_entry', serialize=False, to='backend.productinfo', verbose_name='Предложение')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена')),
+                ('in_stock', models.BooleanField(default=False, verbose_name='В наличии')),
+                ('shop_state', models.BooleanField(default=True, verbose_name='Магазин принимает заказы')),
+                ('document', models.JSONField(verbose_name='Документ')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='backend.category', verbose_name='Категория')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Запись каталога',
+                'verbose_name_plural': 'Каталог для выдачи',
+                'indexes': [models.Index(fields=['shop', 'product_info'], name='catalog_entry_shop'), models.Index(fields=['category', 'product_info'], name='catalog_entry_category')],
+            },
+        ),
+        migrations.RunPython(fill_catalog_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:35
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_rollback_version(apps, schema_editor):
+    """
+    Номер версии у задач отката, версия которых еще не удалена
+    """
+    ImportJob = apps.get_model('backend', 'ImportJob')
+    CatalogVersion = apps.get_model('backend', 'CatalogVersion')
+    ImportJob.objects.filter(rollback_to__isnull=False).update(rollback_version=Subquery(
+        CatalogVersion.objects.filter(id=OuterRef('rollback_to_id')).values('number')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0018_catalog_entries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='rollback_version',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Номер версии отката'),
+        ),
+        migrations.RunPython(fill_rollback_version, migrations.RunPython.noop),
+    ]
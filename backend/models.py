@@ -2,6 +2,8 @@
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.core.validators import MinValueValidator
 from django.utils.translation import gettext_lazy as _
@@ -26,6 +28,32 @@ USER_TYPE_CHOICES = (
 
 )
 
+IMPORT_SOURCE_CHOICES = (
+    ('api', 'Запрос магазина'),
+    ('schedule', 'Автообновление'),
+    ('rollback', 'Откат каталога'),
+)
+
+IMPORT_STATE_CHOICES = (
+    ('queued', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('done', 'Завершен'),
+    ('skipped', 'Пропущен, прайс-лист не изменился'),
+    ('failed', 'Ошибка'),
+)
+
+EXPORT_STATE_CHOICES = (
+    ('queued', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('done', 'Завершен'),
+    ('failed', 'Ошибка'),
+)
+
+IMPORT_METHOD_CHOICES = (
+    ('orm', 'ORM'),
+    ('copy', 'COPY через промежуточную таблицу (PostgreSQL)'),
+)
+
 # Create your models here.
 
 class UserManager(BaseUserManager):
@@ -116,6 +144,17 @@ class Shop(models.Model):
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
     state = models.BooleanField(verbose_name='Принимает ли магазин заказы', default=True)
+    refresh_interval = models.PositiveIntegerField(verbose_name='Интервал автообновления прайса (мин)',
+                                                   blank=True, null=True)
+    next_refresh_at = models.DateTimeField(verbose_name='Следующее автообновление прайса',
+                                           blank=True, null=True, db_index=True)
+    import_method = models.CharField(verbose_name='Способ импорта прайса', choices=IMPORT_METHOD_CHOICES,
+                                     max_length=5, default='orm')
+    catalog_version = models.ForeignKey('CatalogVersion', verbose_name='Текущая версия каталога',
+                                        related_name='+', blank=True, null=True,
+                                        on_delete=models.SET_NULL)
+    # Растет при каждом импорте и обновлении остатков, по ней кэшируется выгрузка прайс-листа
+    catalog_revision = models.PositiveBigIntegerField(verbose_name='Ревизия каталога', default=0)
 
     class Meta:
         verbose_name = 'Магазин'
@@ -150,6 +189,13 @@ class Product(models.Model):
         verbose_name = 'Продукт'
         verbose_name_plural = "Список продуктов"
         ordering = ('name',)
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'category'], name='unique_product'),
+        ]
+        indexes = [
+            # Подсказки по части названия и с опечатками (pg_trgm)
+            GinIndex(fields=['name'], name='product_name_trgm', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return self.name
@@ -166,6 +212,8 @@ class ProductInfo(models.Model):
     quantity = models.PositiveIntegerField(verbose_name='Количество', default=0)
     price = models.DecimalField(verbose_name='Цена', max_digits=10, decimal_places=2)
     price_rrc = models.DecimalField(verbose_name='Рекомендуемая розничная цена', max_digits=10, decimal_places=2)
+    # Название, модель и значения параметров для полнотекстового поиска, пересчитывается при импорте
+    search_vector = SearchVectorField(verbose_name='Поисковый вектор', null=True, editable=False)
 
     class Meta:
         verbose_name = 'Информация о продукте'
@@ -173,6 +221,16 @@ class ProductInfo(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product', 'shop', 'external_id'], name='unique_product_info'),
         ]
+        indexes = [
+            # Поиск предложения магазина по внешнему ИД при обновлении остатков и импорте
+            models.Index(fields=['shop', 'external_id'], name='product_info_shop_external'),
+            # Постраничный вывод каталога магазина по ИД
+            models.Index(fields=['shop', 'id'], name='product_info_shop_id'),
+            # Полнотекстовый поиск товаров
+            GinIndex(fields=['search_vector'], name='product_info_search'),
+            # Подсказки по части модели и с опечатками (pg_trgm)
+            GinIndex(fields=['model'], name='product_info_model_trgm', opclasses=['gin_trgm_ops']),
+        ]
     def __str__(self):
         """Человекочитаемое отображение ProductInfo"""
         product_name = self.product.name if self.product else 'Без названия'
@@ -188,6 +246,9 @@ class Parameter(models.Model):
         verbose_name = 'Имя параметра'
         verbose_name_plural = "Список имен параметров"
         ordering = ('-name',)
+        constraints = [
+            models.UniqueConstraint(fields=['name'], name='unique_parameter'),
+        ]
 
     def __str__(self):
         return self.name
@@ -208,6 +269,58 @@ class ProductParameter(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product_info', 'parameter'], name='unique_product_parameter'),
         ]
+        indexes = [
+            # Фильтр товаров по значению параметра
+            models.Index(fields=['parameter', 'value', 'product_info'], name='product_parameter_value'),
+        ]
+
+
+class CatalogEntry(models.Model):
+    """Готовое к выдаче предложение каталога с колонками фильтров, пересобирается при изменении каталога магазина"""
+    product_info = models.OneToOneField(ProductInfo, verbose_name='Предложение', related_name='catalog_entry',
+                                        primary_key=True, on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='catalog_entries',
+                             on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='catalog_entries',
+                                 on_delete=models.CASCADE)
+    price = models.DecimalField(verbose_name='Цена', max_digits=10, decimal_places=2)
+    in_stock = models.BooleanField(verbose_name='В наличии', default=False)
+    shop_state = models.BooleanField(verbose_name='Магазин принимает заказы', default=True)
+    document = models.JSONField(verbose_name='Документ')
+
+    class Meta:
+        verbose_name = 'Запись каталога'
+        verbose_name_plural = "Каталог для выдачи"
+        indexes = [
+            # Постраничный вывод каталога магазина и категории по ИД предложения
+            models.Index(fields=['shop', 'product_info'], name='catalog_entry_shop'),
+            models.Index(fields=['category', 'product_info'], name='catalog_entry_category'),
+        ]
+
+    def __str__(self):
+        return f"Предложение {self.product_info_id}"
+
+
+class ParameterFacet(models.Model):
+    """Число предложений открытых магазинов по значению параметра в категории, пересчитывается после импорта"""
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='facets',
+                                 on_delete=models.CASCADE)
+    parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='facets',
+                                  on_delete=models.CASCADE)
+    value = models.CharField(verbose_name='Значение', max_length=100)
+    # Значение как число для фильтров по диапазону, если это число
+    value_number = models.FloatField(verbose_name='Числовое значение', blank=True, null=True)
+    offers = models.PositiveIntegerField(verbose_name='Предложений', default=0)
+
+    class Meta:
+        verbose_name = 'Фасет параметра'
+        verbose_name_plural = "Список фасетов параметров"
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'parameter', 'value'], name='unique_parameter_facet'),
+        ]
+        indexes = [
+            models.Index(fields=['parameter', 'value_number'], name='parameter_facet_number'),
+        ]
 
 
 class Contact(models.Model):
@@ -276,6 +389,117 @@ class OrderItem(models.Model):
         ]
 
 
+class ImportJob(models.Model):
+    """Фоновая задача импорта прайс-листа поставщика"""
+    user = models.ForeignKey(User, verbose_name='Пользователь',
+                             related_name='import_jobs',
+                             on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='import_jobs',
+                             blank=True, null=True,
+                             on_delete=models.SET_NULL)
+    url = models.URLField(verbose_name='Ссылка на прайс-лист', blank=True)
+    file = models.FileField(verbose_name='Загруженный прайс-лист', upload_to='imports/%Y/%m/%d', blank=True)
+    rollback_to = models.ForeignKey('CatalogVersion', verbose_name='Откат к версии каталога',
+                                    related_name='rollback_jobs', blank=True, null=True,
+                                    on_delete=models.SET_NULL)
+    rollback_version = models.PositiveIntegerField(verbose_name='Номер версии отката', blank=True, null=True)
+    mode = models.CharField(verbose_name='Режим импорта', max_length=10, default='diff')
+    force = models.BooleanField(verbose_name='Импорт без проверки изменений', default=False)
+    source = models.CharField(verbose_name='Источник запуска', choices=IMPORT_SOURCE_CHOICES, max_length=10,
+                              default='api')
+    refresh_interval = models.PositiveIntegerField(verbose_name='Новый интервал автообновления (мин)',
+                                                   blank=True, null=True)
+    state = models.CharField(verbose_name='Статус', choices=IMPORT_STATE_CHOICES, max_length=10, default='queued')
+    task_id = models.CharField(verbose_name='ИД задачи Celery', max_length=255, blank=True)
+    processed = models.PositiveIntegerField(verbose_name='Обработано товаров', default=0)
+    total = models.PositiveIntegerField(verbose_name='Всего товаров', blank=True, null=True)
+    errors = models.JSONField(verbose_name='Ошибки', default=list, blank=True)
+    stats = models.JSONField(verbose_name='Статистика по этапам', default=dict, blank=True)
+    queries = models.PositiveIntegerField(verbose_name='Запросов к БД', default=0)
+    rows_inserted = models.PositiveIntegerField(verbose_name='Вставлено строк', default=0)
+    rows_updated = models.PositiveIntegerField(verbose_name='Обновлено строк', default=0)
+    rows_deleted = models.PositiveIntegerField(verbose_name='Удалено строк', default=0)
+    peak_memory = models.PositiveBigIntegerField(verbose_name='Пик памяти (байт)', blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Задача импорта'
+        verbose_name_plural = "Список задач импорта"
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'Импорт #{self.id} ({self.get_state_display()})'
+
+    @property
+    def duration(self):
+        """Длительность выполнения в секундах"""
+        if self.started_at and self.finished_at:
+            return round((self.finished_at - self.started_at).total_seconds(), 3)
+        return None
+
+
+class ExportJob(models.Model):
+    """Фоновая выгрузка прайс-листа магазина в файл для скачивания"""
+    user = models.ForeignKey(User, verbose_name='Пользователь',
+                             related_name='export_jobs',
+                             on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='export_jobs',
+                             on_delete=models.CASCADE)
+    format = models.CharField(verbose_name='Формат', max_length=10, default='yaml')
+    compression = models.CharField(verbose_name='Сжатие', max_length=10, blank=True)
+    catalog_revision = models.PositiveBigIntegerField(verbose_name='Ревизия каталога', default=0)
+    state = models.CharField(verbose_name='Статус', choices=EXPORT_STATE_CHOICES, max_length=10, default='queued')
+    task_id = models.CharField(verbose_name='ИД задачи Celery', max_length=255, blank=True)
+    processed = models.PositiveIntegerField(verbose_name='Выгружено товаров', default=0)
+    total = models.PositiveIntegerField(verbose_name='Всего товаров', blank=True, null=True)
+    errors = models.JSONField(verbose_name='Ошибки', default=list, blank=True)
+    file = models.FileField(verbose_name='Файл выгрузки', upload_to='export_jobs/%Y/%m/%d', blank=True)
+    size = models.PositiveBigIntegerField(verbose_name='Размер файла (байт)', blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    expires_at = models.DateTimeField(verbose_name='Файл хранится до', blank=True, null=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Задача выгрузки'
+        verbose_name_plural = "Список задач выгрузки"
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'Выгрузка #{self.id} ({self.get_state_display()})'
+
+    @property
+    def duration(self):
+        """Длительность выполнения в секундах"""
+        if self.started_at and self.finished_at:
+            return round((self.finished_at - self.started_at).total_seconds(), 3)
+        return None
+
+
+class ShopFeed(models.Model):
+    """Состояние прайс-листа магазина на момент последней загрузки по URL (пустой URL - загруженный файл)"""
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='feeds',
+                             on_delete=models.CASCADE)
+    url = models.URLField(verbose_name='Ссылка на прайс-лист', blank=True)
+    etag = models.CharField(verbose_name='ETag', max_length=255, blank=True)
+    last_modified = models.CharField(verbose_name='Last-Modified', max_length=64, blank=True)
+    content_hash = models.CharField(verbose_name='SHA-256 содержимого', max_length=64, blank=True)
+    checked_at = models.DateTimeField(verbose_name='Последняя проверка', blank=True, null=True)
+    imported_at = models.DateTimeField(verbose_name='Последний импорт', blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Прайс-лист магазина'
+        verbose_name_plural = "Список прайс-листов магазинов"
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'url'], name='unique_shop_feed'),
+        ]
+
+    def __str__(self):
+        return self.url
+
+
 class ConfirmEmailToken(models.Model):
     # objects = models.manager.Manager()
     class Meta:
@@ -314,4 +538,28 @@ class ConfirmEmailToken(models.Model):
         return super(ConfirmEmailToken, self).save(*args, **kwargs)
 
     def __str__(self):
-        return "Password reset token for user {user}".format(user=self.user)
\ No newline at end of file
+        return "Password reset token for user {user}".format(user=self.user)
+
+
+class CatalogVersion(models.Model):
+    """Снимок каталога магазина после импорта, к которому можно откатиться"""
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='catalog_versions',
+                             on_delete=models.CASCADE)
+    job = models.ForeignKey(ImportJob, verbose_name='Задача импорта', related_name='catalog_versions',
+                            blank=True, null=True,
+                            on_delete=models.SET_NULL)
+    number = models.PositiveIntegerField(verbose_name='Номер версии')
+    file = models.FileField(verbose_name='Снимок каталога', upload_to='catalog_versions/%Y/%m/%d')
+    goods = models.PositiveIntegerField(verbose_name='Предложений', default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Версия каталога'
+        verbose_name_plural = "Список версий каталога"
+        ordering = ('-number',)
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'number'], name='unique_catalog_version'),
+        ]
+
+    def __str__(self):
+        return f'{self.shop} v{self.number}'
@@ -0,0 +1,29 @@
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Разбор NDJSON: по JSON объекту на строку.
+    Возвращает генератор, строки тела запроса читаются по мере обработки записей
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return iter(())
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        return self.iter_records(stream, encoding)
+
+    @staticmethod
+    def iter_records(stream, encoding):
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line.decode(encoding))
+            except ValueError as error:
+                raise ParseError(f'Некорректный JSON в строке {number}: {error}')
@@ -0,0 +1,97 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from backend.models import Shop, ImportJob
+
+
+def active_jobs():
+    """
+    Задачи импорта в очереди или в работе. Зависшие дольше IMPORT_JOB_TIMEOUT не учитываются
+    """
+    return ImportJob.objects.filter(
+        state__in=('queued', 'running'),
+        created_at__gte=timezone.now() - timedelta(seconds=settings.IMPORT_JOB_TIMEOUT)
+    )
+
+
+def find_pending_job(user_id, url, mode, force=False, refresh_interval=None):
+    """
+    Задача импорта того же прайс-листа, которая еще ждет в очереди, - к ней присоединяется повторный запрос.
+    Запущенная задача не подходит: прайс-лист уже мог быть загружен до повторного запроса.
+    Запрос с force присоединяется только к задаче с force, запрос со сменой интервала автообновления - ни к какой
+    """
+    if refresh_interval is not None:
+        return None
+    jobs = active_jobs().filter(user_id=user_id, state='queued', url=url, mode=mode, file='')
+    if force:
+        jobs = jobs.filter(force=True)
+    return jobs.order_by('-id').first()
+
+
+def next_refresh_time(interval, now=None):
+    """
+    Время следующего автообновления: интервал плюс случайный сдвиг,
+    чтобы прайс-листы с одинаковым интервалом не загружались одновременно
+    """
+    now = now or timezone.now()
+    minutes = interval * (1 + random.uniform(0, settings.FEED_REFRESH_JITTER))
+    return now + timedelta(minutes=minutes)
+
+
+def schedule_due_feeds():
+    """
+    Постановка в очередь импорта прайс-листов магазинов, у которых подошло время автообновления.
+    Одновременно выполняется не больше FEED_REFRESH_CONCURRENCY импортов,
+    для магазина с незавершенным импортом новый не ставится.
+    Возвращает ИД созданных задач импорта
+    """
+    from backend.tasks import import_price_list_task
+
+    now = timezone.now()
+    slots = settings.FEED_REFRESH_CONCURRENCY - active_jobs().count()
+    if slots <= 0:
+        return []
+
+    jobs = []
+    with transaction.atomic():
+        # skip_locked - параллельный запуск планировщика не заберет те же магазины
+        shops = Shop.objects.select_for_update(skip_locked=True).filter(
+            Q(next_refresh_at__lte=now) | Q(next_refresh_at__isnull=True),
+            refresh_interval__isnull=False,
+            url__isnull=False,
+            user__isnull=False,
+        ).exclude(url='').exclude(
+            user_id__in=active_jobs().values('user_id')
+        ).order_by('next_refresh_at')[:slots]
+
+        for shop in shops:
+            shop.next_refresh_at = next_refresh_time(shop.refresh_interval, now)
+            shop.save(update_fields=['next_refresh_at'])
+            jobs.append(ImportJob.objects.create(user_id=shop.user_id, shop=shop, url=shop.url, source='schedule'))
+
+    for job in jobs:
+        # Случайная задержка старта разносит импорты внутри такта планировщика
+        result = import_price_list_task.apply_async(
+            (job.id,), countdown=random.uniform(0, settings.FEED_REFRESH_START_JITTER))
+        ImportJob.objects.filter(id=job.id).update(task_id=result.id)
+    return [job.id for job in jobs]
+
+
+def update_shop_schedule(job):
+    """
+    Сохранение URL прайс-листа и интервала автообновления магазина по итогам импорта
+    """
+    if not job.shop_id:
+        return
+    shop = Shop.objects.get(id=job.shop_id)
+    if job.url and job.state in ('done', 'skipped'):
+        shop.url = job.url
+    if job.refresh_interval is not None:
+        shop.refresh_interval = job.refresh_interval or None
+    shop.next_refresh_at = next_refresh_time(shop.refresh_interval) if shop.refresh_interval else None
+    shop.save(update_fields=['url', 'refresh_interval', 'next_refresh_at'])
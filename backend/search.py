@@ -0,0 +1,75 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+from backend.models import Product, ProductInfo, ProductParameter
+
+
+# Конфигурация полнотекстового поиска PostgreSQL: стемминг и стоп-слова русского языка
+SEARCH_CONFIG = 'russian'
+
+# Предложений в одном запросе пересчета поисковых векторов
+SEARCH_CHUNK_SIZE = 5000
+
+# Поисковый документ предложения: название продукта (вес A), модель (B) и значения параметров (C).
+# Считаются только переданные предложения, перезаписываются только изменившиеся векторы
+UPDATE_SEARCH_VECTORS_SQL = """
+    UPDATE {product_info} AS offer
+    SET search_vector = document.vector
+    FROM (
+        SELECT info.id,
+               setweight(to_tsvector(%(config)s::regconfig, product.name), 'A')
+               || setweight(to_tsvector(%(config)s::regconfig, info.model), 'B')
+               || setweight(to_tsvector(%(config)s::regconfig,
+                                        coalesce(string_agg(parameter.value, ' ' ORDER BY parameter.id), '')), 'C')
+               AS vector
+        FROM {product_info} AS info
+        JOIN {product} AS product ON product.id = info.product_id
+        LEFT JOIN {product_parameter} AS parameter ON parameter.product_info_id = info.id
+        WHERE info.id = ANY(%(product_info_ids)s)
+        GROUP BY info.id, product.name
+    ) AS document
+    WHERE offer.id = document.id AND offer.search_vector IS DISTINCT FROM document.vector
+"""
+
+
+def update_search_vectors(product_info_ids):
+    """
+    Пересчет поисковых векторов предложений по ИД, запросом на пачку.
+    Возвращает число обновленных предложений, вне PostgreSQL поиск не поддерживается и ничего не делает
+    """
+    if connection.vendor != 'postgresql':
+        return 0
+
+    sql = UPDATE_SEARCH_VECTORS_SQL.format(**{
+        key: connection.ops.quote_name(model._meta.db_table)
+        for key, model in (('product', Product), ('product_info', ProductInfo),
+                           ('product_parameter', ProductParameter))
+    })
+    product_info_ids = sorted(set(product_info_ids))
+    updated = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_info_ids), SEARCH_CHUNK_SIZE):
+            cursor.execute(sql, {'config': SEARCH_CONFIG,
+                                 'product_info_ids': product_info_ids[start:start + SEARCH_CHUNK_SIZE]})
+            updated += cursor.rowcount
+    return updated
+
+
+def search_query(text):
+    """
+    Поисковый запрос в синтаксисе поисковых систем: слова через пробел, "фраза", OR, -исключение
+    """
+    return SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+
+
+def search_products(queryset, text, vector='search_vector'):
+    """
+    Предложения, подходящие под поисковый запрос, с релевантностью в поле rank.
+    vector - путь к поисковому вектору предложения, условие @@ по нему выполняется по GIN-индексу.
+    Релевантность приводится к double precision: в курсоре страниц она передается числом и должна
+    сравниваться с вычисленной без потери точности real
+    """
+    query = search_query(text)
+    return queryset.filter(**{vector: query}).annotate(rank=Cast(SearchRank(F(vector), query), FloatField()))
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from backend.models import User, Category, Shop, ProductInfo, Product, ProductParameter, OrderItem, Order, Contact, USER_TYPE_CHOICES
+from backend.models import User, Category, Shop, ProductInfo, Product, ProductParameter, OrderItem, Order, Contact, USER_TYPE_CHOICES, \
+    ImportJob, CatalogVersion, ExportJob
 from backend.models import STATE_CHOICES
 
 class ContactSerializer(serializers.ModelSerializer):
@@ -83,6 +84,13 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class CatalogEntrySerializer(serializers.BaseSerializer):
+    """Предложение из каталога для выдачи: документ уже собран в формате ProductInfoSerializer"""
+
+    def to_representation(self, instance):
+        return instance.document
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
@@ -168,4 +176,38 @@ class PartnerOrderStatusSerializer(serializers.Serializer):
                 f'Недопустимый статус. Допустимо: {status_list}'
             )
         
-        return value
\ No newline at end of file
+        return value
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    state_display = serializers.CharField(source='get_state_display', read_only=True)
+    rollback_to = serializers.IntegerField(source='rollback_version', read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'url', 'mode', 'force', 'source', 'rollback_to', 'state', 'state_display', 'processed', 'total',
+                  'errors', 'stats', 'queries', 'rows_inserted', 'rows_updated', 'rows_deleted', 'peak_memory',
+                  'created_at', 'started_at', 'finished_at', 'duration',)
+        read_only_fields = fields
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    state_display = serializers.CharField(source='get_state_display', read_only=True)
+
+    class Meta:
+        model = ExportJob
+        fields = ('id', 'format', 'compression', 'catalog_revision', 'state', 'state_display', 'processed', 'total',
+                  'errors', 'size', 'created_at', 'started_at', 'finished_at', 'expires_at', 'duration',)
+        read_only_fields = fields
+
+
+class CatalogVersionSerializer(serializers.ModelSerializer):
+    is_live = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CatalogVersion
+        fields = ('number', 'goods', 'job', 'created_at', 'is_live',)
+        read_only_fields = fields
+
+    def get_is_live(self, obj):
+        return obj.shop.catalog_version_id == obj.id
@@ -0,0 +1,144 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, models, transaction
+
+from backend.catalog import refresh_catalog_entries
+from backend.exports import bump_catalog_revision
+from backend.importer import chunked
+from backend.models import ProductInfo
+
+
+# Записей в одном UPDATE
+STOCK_BATCH_SIZE = 5000
+
+# Ошибок в ответе не больше этого числа
+MAX_REPORTED_ERRORS = 100
+
+# Обновление пачки остатков и цен одним запросом. Пустые значения оставляют текущие,
+# строки без изменений не перезаписываются. Возвращает ИД обновленных предложений для пересборки каталога
+STOCK_UPDATE_SQL = """
+    UPDATE {table} AS product_info
+    SET quantity = COALESCE(stock.quantity::integer, product_info.quantity),
+        price = COALESCE(stock.price::numeric, product_info.price),
+        price_rrc = COALESCE(stock.price_rrc::numeric, product_info.price_rrc)
+    FROM (VALUES {values}) AS stock (external_id, quantity, price, price_rrc)
+    WHERE product_info.shop_id = %s
+      AND product_info.external_id = stock.external_id::integer
+      AND (product_info.quantity, product_info.price, product_info.price_rrc) IS DISTINCT FROM (
+          COALESCE(stock.quantity::integer, product_info.quantity),
+          COALESCE(stock.price::numeric, product_info.price),
+          COALESCE(stock.price_rrc::numeric, product_info.price_rrc))
+    RETURNING product_info.id
+"""
+
+STOCK_FOUND_SQL = """
+    SELECT external_id FROM {table} WHERE shop_id = %s AND external_id = ANY(%s)
+"""
+
+
+def field_bounds(name):
+    """
+    Допустимый диапазон значений поля предложения в БД: для целых - по типу поля,
+    для цен - по max_digits и decimal_places (верхняя граница не включается)
+    """
+    field = ProductInfo._meta.get_field(name)
+    if isinstance(field, models.DecimalField):
+        return 0, Decimal(10) ** (field.max_digits - field.decimal_places)
+    return connection.ops.integer_field_range(field.get_internal_type())
+
+
+def clean_integer(record, name, error):
+    """
+    Целое значение записи в пределах поля предложения, ValueError с текстом error - если не целое
+    """
+    try:
+        value = int(record[name])
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(error)
+    low, high = field_bounds(name)
+    if value < low or (high is not None and value > high):
+        raise ValueError(f'{error}: допустимо от {low} до {high}')
+    return value
+
+
+def clean_stock_record(record):
+    """
+    Проверка записи остатков. Возвращает кортеж (external_id, quantity, price, price_rrc),
+    отсутствующие поля - None. Значения за пределами полей БД отклоняются здесь, а не ошибкой всей пачки
+    """
+    if not isinstance(record, dict) or 'external_id' not in record:
+        raise ValueError('отсутствует external_id')
+    external_id = clean_integer(record, 'external_id', 'некорректный external_id')
+
+    quantity = None
+    if record.get('quantity') is not None:
+        quantity = clean_integer(record, 'quantity', 'некорректное количество')
+
+    prices = []
+    for field in ('price', 'price_rrc'):
+        value = record.get(field)
+        if value is not None:
+            try:
+                value = Decimal(str(value))
+                if not value.is_finite():
+                    raise InvalidOperation
+                value = value.quantize(Decimal('0.01'))
+            except InvalidOperation:
+                raise ValueError(f'некорректное значение {field}')
+            if value < 0:
+                raise ValueError(f'{field} не может быть отрицательной')
+            if value >= field_bounds(field)[1]:
+                raise ValueError(f'{field} больше допустимой {field_bounds(field)[1] - Decimal("0.01")}')
+        prices.append(value)
+
+    return (external_id, quantity, *prices)
+
+
+def apply_stock_updates(shop_id, records, batch_size=STOCK_BATCH_SIZE):
+    """
+    Обновление остатков и цен предложений магазина пачками UPDATE ... FROM (VALUES ...).
+    Выполняется в одной транзакции: ошибка разбора тела запроса откатывает уже примененные пачки.
+    Возвращает число обновленных строк, внешние ИД не найденных предложений и ошибки записей
+    """
+    table = connection.ops.quote_name(ProductInfo._meta.db_table)
+    result = {'updated': 0, 'not_found': [], 'errors': []}
+
+    def cleaned():
+        for number, record in enumerate(records):
+            try:
+                yield clean_stock_record(record)
+            except ValueError as error:
+                if len(result['errors']) < MAX_REPORTED_ERRORS:
+                    result['errors'].append(f'Запись #{number}: {error}')
+
+    with transaction.atomic():
+        for chunk in chunked(cleaned(), batch_size):
+            apply_stock_chunk(table, shop_id, chunk, result)
+        if result['updated']:
+            bump_catalog_revision(shop_id)
+    return result
+
+
+def apply_stock_chunk(table, shop_id, chunk, result):
+    """
+    Обновление одной пачки записей остатков
+    """
+    # При повторе external_id в пачке применяется последняя запись
+    rows = list({row[0]: row for row in chunk}.values())
+    with connection.cursor() as cursor:
+        cursor.execute(
+            STOCK_UPDATE_SQL.format(table=table, values=', '.join(['(%s, %s, %s, %s)'] * len(rows))),
+            [value for row in rows for value in row] + [shop_id]
+        )
+        updated_ids = [product_info_id for product_info_id, in cursor.fetchall()]
+        result['updated'] += len(updated_ids)
+
+        external_ids = [row[0] for row in rows]
+        cursor.execute(STOCK_FOUND_SQL.format(table=table), [shop_id, external_ids])
+        found = {external_id for external_id, in cursor.fetchall()}
+    if len(result['not_found']) < MAX_REPORTED_ERRORS:
+        result['not_found'].extend(
+            [external_id for external_id in external_ids if external_id not in found][
+                :MAX_REPORTED_ERRORS - len(result['not_found'])])
+    if updated_ids:
+        refresh_catalog_entries(updated_ids)
@@ -0,0 +1,61 @@
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import Exists, OuterRef
+
+from backend.models import Product, ProductInfo
+
+
+# Короче этого подсказки не ищутся: по одному символу триграммный индекс почти ничего не отсекает
+SUGGEST_MIN_LENGTH = 2
+
+
+def normalize_query(text):
+    """
+    Запрос подсказок без различий в регистре и пробелах, чтобы «iPhon  XR» и «iphon xr» попадали в один ключ кэша
+    """
+    return ' '.join(text.lower().split())
+
+
+def suggest(text, limit):
+    """
+    Подсказки по началу или части названия товара и модели, с опечатками.
+    Ответы кэшируются в процессе на SUGGEST_CACHE_TTL секунд
+    """
+    query = normalize_query(text)
+    if len(query) < SUGGEST_MIN_LENGTH:
+        return {'names': [], 'models': []}
+    return cached_suggest(query, limit, int(time.monotonic() // settings.SUGGEST_CACHE_TTL))
+
+
+@lru_cache(maxsize=settings.SUGGEST_CACHE_SIZE)
+def cached_suggest(query, limit, period):
+    """
+    Подсказки из базы. period - номер интервала кэширования: в новом интервале ключ другой,
+    а записи прошлых интервалов вытесняются как самые давние
+    """
+    return {'names': find_names(query, limit), 'models': find_models(query, limit)}
+
+
+def find_names(query, limit):
+    """
+    Названия товаров, которые продаются в открытых магазинах, по убыванию сходства слов с запросом.
+    Условие %> выполняется по триграммному GIN-индексу названия
+    """
+    on_sale = ProductInfo.objects.filter(product=OuterRef('pk'), shop__state=True)
+    names = Product.objects.filter(name__trigram_word_similar=query).filter(Exists(on_sale)).annotate(
+        similarity=TrigramWordSimilarity(query, 'name')).order_by('-similarity', 'name').values_list(
+        'name', flat=True).distinct()
+    return list(names[:limit])
+
+
+def find_models(query, limit):
+    """
+    Модели предложений открытых магазинов по убыванию сходства с запросом, по триграммному индексу модели
+    """
+    models = ProductInfo.objects.filter(model__trigram_word_similar=query, shop__state=True).exclude(
+        model='').annotate(similarity=TrigramWordSimilarity(query, 'model')).order_by(
+        '-similarity', 'model').values_list('model', flat=True).distinct()
+    return list(models[:limit])
@@ -172,4 +172,67 @@ def send_order_item_quantity_changed_email_task(order_id, user_id, changes):
         return f"Уведомление об изменении {len(changes)} товаров отправлено на {user.email}"
         
     except Exception as e:
-        return f"Ошибка отправки уведомления: {str(e)}"
\ No newline at end of file
+        return f"Ошибка отправки уведомления: {str(e)}"
+
+@shared_task(bind=True, max_retries=None)
+def import_price_list_task(self, job_id):
+    """Асинхронный импорт прайс-листа поставщика"""
+    from backend.importer import run_import_job
+
+    job = run_import_job(
+        job_id,
+        progress=lambda processed: self.update_state(state='PROGRESS', meta={'processed': processed})
+    )
+    if job.state == 'queued':
+        # Идет другой импорт этого магазина - ждем своей очереди
+        raise self.retry(countdown=settings.IMPORT_QUEUE_RETRY_DELAY)
+    if job.state == 'failed':
+        return f"Ошибка импорта #{job_id}: {'; '.join(job.errors)}"
+    return f"Импорт #{job_id} завершен, обработано товаров: {job.processed}"
+
+
+@shared_task
+def schedule_feed_refresh_task():
+    """Периодическая постановка в очередь автообновления прайс-листов (Celery beat)"""
+    from backend.scheduler import schedule_due_feeds
+
+    jobs = schedule_due_feeds()
+    return f"Запущено автообновлений прайс-листов: {len(jobs)}"
+
+
+@shared_task
+def collect_catalog_versions_task():
+    """Периодическое удаление старых версий каталогов магазинов (Celery beat)"""
+    from backend.versions import collect_catalog_versions
+
+    deleted = collect_catalog_versions()
+    return f"Удалено версий каталогов: {deleted}"
+
+
+@shared_task
+def export_price_list_task(job_id):
+    """Асинхронная выгрузка прайс-листа магазина в файл"""
+    from backend.exports import run_export_job
+
+    job = run_export_job(job_id)
+    if job.state == 'failed':
+        return f"Ошибка выгрузки #{job_id}: {'; '.join(job.errors)}"
+    return f"Выгрузка #{job_id} завершена, выгружено товаров: {job.processed}"
+
+
+@shared_task
+def collect_export_jobs_task():
+    """Периодическое удаление файлов фоновых выгрузок с истекшим сроком хранения (Celery beat)"""
+    from backend.exports import collect_export_jobs
+
+    deleted = collect_export_jobs()
+    return f"Удалено задач выгрузки: {deleted}"
+
+
+@shared_task
+def refresh_facets_task(category_ids):
+    """Асинхронный пересчет фасетов категорий, например после открытия или закрытия магазина"""
+    from backend.facets import refresh_facets
+
+    created = refresh_facets(category_ids)
+    return f"Пересчитаны фасеты {len(category_ids)} категорий: {created}"
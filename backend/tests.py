@@ -1,3 +1,167 @@
-from django.test import TestCase
+import copy
+import os
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+import yaml
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase
+
+from backend.copy_importer import CopyCatalogImporter
+from backend.importer import CatalogImporter, MODE_DIFF, MODE_REPLACE
+from backend.models import (
+    CatalogEntry, Category, Order, OrderItem, Parameter, Product, ProductInfo, ProductParameter, Shop, User
+)
+
+
+DATA_DIR = os.path.join(settings.BASE_DIR, 'data')
+FEED_PATH = os.path.join(DATA_DIR, 'shop1.yaml')
+
+
+def load_feed(path=FEED_PATH):
+    with open(path, encoding='utf-8') as file:
+        return yaml.safe_load(file)
+
+
+def per_item_import(user_id, data):
+    """
+    Импорт по товару, как его выполнял PartnerUpdate до пакетного импорта: эталон для сравнения каталога
+    """
+    shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=user_id)
+    for category in data['categories']:
+        category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
+        category_object.shops.add(shop.id)
+    ProductInfo.objects.filter(shop_id=shop.id).delete()
+    for item in data['goods']:
+        product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
+        product_info = ProductInfo.objects.create(product_id=product.id, external_id=item['id'], model=item['model'],
+                                                  price=item['price'], price_rrc=item['price_rrc'],
+                                                  quantity=item['quantity'], shop_id=shop.id)
+        for name, value in item['parameters'].items():
+            parameter, _ = Parameter.objects.get_or_create(name=name)
+            ProductParameter.objects.create(product_info_id=product_info.id, parameter_id=parameter.id, value=value)
+    return shop
+
+
+def catalog_rows(shop):
+    """
+    Каталог магазина без ИД строк: предложения с продуктом, категорией и параметрами
+    """
+    parameters = {}
+    for product_info_id, name, value in ProductParameter.objects.filter(
+            product_info__shop=shop).values_list('product_info_id', 'parameter__name', 'value'):
+        parameters.setdefault(product_info_id, set()).add((name, value))
+    return sorted(
+        (external_id, name, category_id, model, price, price_rrc, quantity, frozenset(parameters.get(pk, ())))
+        for pk, external_id, name, category_id, model, price, price_rrc, quantity in ProductInfo.objects.filter(
+            shop=shop).values_list('id', 'external_id', 'product__name', 'product__category_id', 'model', 'price',
+                                   'price_rrc', 'quantity')
+    )
+
+
+class CatalogImportTest(TransactionTestCase):
+    """
+    Пакетный импорт прайс-листа: тот же каталог, что при импорте по товару, и импорт изменений в режиме diff.
+    TransactionTestCase: в PostgreSQL справочники пополняются в отдельном соединении и фиксируются сразу
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(email='shop@example.com', type='shop', is_active=True)
+        self.data = load_feed()
+
+    def assert_same_as_per_item(self, importer_class):
+        shop = per_item_import(self.user.id, self.data)
+        expected = catalog_rows(shop)
+        products, parameters = Product.objects.count(), Parameter.objects.count()
+        ProductInfo.objects.filter(shop=shop).delete()
+
+        importer = importer_class(self.user.id, mode=MODE_REPLACE)
+        self.assertEqual(importer.run(load_feed()), shop)
+
+        self.assertEqual(catalog_rows(shop), expected)
+        self.assertEqual(Product.objects.count(), products)
+        self.assertEqual(Parameter.objects.count(), parameters)
+        self.assertEqual(importer.processed, len(self.data['goods']))
+        self.assertEqual(CatalogEntry.objects.filter(shop=shop).count(), len(expected))
+        self.assertEqual(importer.stats['product_infos']['inserted'], len(expected))
+
+    def test_same_catalog_as_per_item_import(self):
+        self.assert_same_as_per_item(CatalogImporter)
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY доступен только на PostgreSQL')
+    def test_copy_importer_same_catalog_as_per_item_import(self):
+        self.assert_same_as_per_item(CopyCatalogImporter)
+
+    def test_diff_import_changes_adds_and_retires_offers(self):
+        shop = CatalogImporter(self.user.id).run(self.data)
+        ids = dict(ProductInfo.objects.filter(shop=shop).values_list('external_id', 'id'))
+        goods = self.data['goods']
+        ordered, dropped = goods[2]['id'], goods[3]['id']
+        order = Order.objects.create(user=self.user, state='basket')
+        OrderItem.objects.create(order=order, product_info_id=ids[ordered], quantity=1)
+
+        data = copy.deepcopy(self.data)
+        data['goods'][0]['price'] += 1000
+        data['goods'][1]['parameters']['Цвет'] = 'синий'
+        new_item = dict(copy.deepcopy(goods[0]), id=1, model='new/model')
+        data['goods'] = data['goods'][:2] + data['goods'][4:] + [new_item]
+        importer = CatalogImporter(self.user.id, mode=MODE_DIFF)
+        importer.run(data)
+
+        offers = {offer.external_id: offer for offer in ProductInfo.objects.filter(shop=shop)}
+        # ИД сохраняются, изменения применяются на месте
+        for item in goods[:2] + goods[4:]:
+            self.assertEqual(offers[item['id']].id, ids[item['id']])
+        self.assertEqual(offers[goods[0]['id']].price, Decimal(goods[0]['price'] + 1000))
+        self.assertEqual(
+            ProductParameter.objects.get(product_info_id=ids[goods[1]['id']], parameter__name='Цвет').value, 'синий')
+        # Пропавшее предложение без заказов удаляется, с позицией в корзине - обнуляется по остатку
+        self.assertNotIn(dropped, offers)
+        self.assertEqual(offers[ordered].id, ids[ordered])
+        self.assertEqual(offers[ordered].quantity, 0)
+        self.assertTrue(OrderItem.objects.filter(order=order, product_info_id=ids[ordered]).exists())
+        # Новое предложение добавляется
+        self.assertEqual(offers[1].model, 'new/model')
+
+        self.assertEqual(importer.stats['product_infos']['inserted'], 1)
+        self.assertEqual(importer.stats['product_infos_update']['updated'], 1)
+        self.assertEqual(importer.stats['retire']['updated'], 1)
+        self.assertEqual(CatalogEntry.objects.filter(shop=shop).count(), len(offers))
+        self.assertEqual(CatalogEntry.objects.get(product_info_id=ids[goods[0]['id']]).document['price'],
+                         f'{goods[0]["price"] + 1000:.2f}')
+
+    def test_unchanged_diff_import_writes_nothing(self):
+        shop = CatalogImporter(self.user.id).run(self.data)
+        ids = sorted(ProductInfo.objects.filter(shop=shop).values_list('id', flat=True))
+
+        importer = CatalogImporter(self.user.id, mode=MODE_DIFF)
+        importer.run(load_feed())
+
+        self.assertEqual(sorted(ProductInfo.objects.filter(shop=shop).values_list('id', flat=True)), ids)
+        for phase in ('product_infos', 'product_infos_update', 'product_parameters', 'retire'):
+            entry = importer.stats.get(phase, {})
+            self.assertFalse(entry.get('inserted') or entry.get('updated') or entry.get('deleted'), phase)
+
+
+class GenerateLoadDataTest(TransactionTestCase):
+    """
+    Данные нагрузочного тестирования совместимы с импортом прайс-листов, по которым они сгенерированы
+    """
+
+    def test_feeds_import_after_generated_data(self):
+        call_command('generate_load_data', '--shops', '2', '--products', '100', '--buyers', '1', '--orders', '1',
+                     stdout=StringIO())
+        feeds = [load_feed(os.path.join(DATA_DIR, name)) for name in sorted(os.listdir(DATA_DIR))
+                 if name.endswith('.yaml')]
+        categories = {category['id']: category['name'] for feed in feeds for category in feed['categories']}
+        self.assertEqual(dict(Category.objects.filter(id__in=categories).values_list('id', 'name')), categories)
+
+        call_command('import_shop', DATA_DIR, stdout=StringIO())
+
+        self.assertEqual(Category.objects.count(), len(categories))
+        for feed in feeds:
+            self.assertEqual(ProductInfo.objects.filter(shop__name=feed['shop']).count(), len(feed['goods']))
+        self.assertEqual(CatalogEntry.objects.count(), ProductInfo.objects.count())
@@ -0,0 +1,109 @@
+from contextlib import contextmanager
+
+from django.db import IntegrityError, connection, connections
+
+
+# Строк справочника в одном запросе
+UPSERT_BATCH_SIZE = 1000
+
+# Выборка ИД уже существующих строк пачки
+SELECT_SQL = """
+    WITH new_rows ({columns}) AS (VALUES {values})
+    SELECT {table}.id, {table_columns} FROM {table} JOIN new_rows ON {join}
+"""
+
+# Вставка строк пачки в порядке ключей, строки, нарушающие уникальность, пропускаются
+INSERT_SQL = """
+    INSERT INTO {table} ({columns}) VALUES {values}
+    ON CONFLICT DO NOTHING
+"""
+
+
+def upsert_ids(model, fields, rows, batch_size=UPSERT_BATCH_SIZE):
+    """
+    Поиск и создание строк справочника по уникальному набору полей fields.
+    rows - кортежи значений fields. Возвращает словарь {кортеж значений: ИД} и число вставленных строк.
+
+    Сначала ИД ищутся в транзакции импорта. Недостающие строки вставляются через insert_missing
+    и сразу фиксируются, после чего их ИД дочитываются. Ключ, не найденный и после вставки, - IntegrityError
+    """
+    rows = sorted(set(rows))
+    ids = {}
+    for start in range(0, len(rows), batch_size):
+        _select_batch(model, fields, rows[start:start + batch_size], ids)
+    missing = [row for row in rows if row not in ids]
+    if not missing:
+        return ids, 0
+
+    inserted = insert_missing(model, fields, missing, batch_size=batch_size)
+    for start in range(0, len(missing), batch_size):
+        _select_batch(model, fields, missing[start:start + batch_size], ids)
+    missing = [row for row in missing if row not in ids]
+    if missing:
+        raise IntegrityError(f'Не удалось получить ИД строк {model._meta.db_table}: {missing[:10]}')
+    return ids, inserted
+
+
+def insert_missing(model, fields, rows, batch_size=UPSERT_BATCH_SIZE):
+    """
+    Вставка строк общего справочника (категории, продукты, имена параметров) через INSERT ... ON CONFLICT
+    DO NOTHING. Возвращает число вставленных строк.
+
+    В PostgreSQL строки пишутся в отдельном соединении в режиме автофиксации: каждая пачка фиксируется
+    сразу, а не в конце импорта, поэтому импорты разных магазинов не ждут незафиксированных строк
+    справочников друг друга. В остальных БД строки пишутся в текущей транзакции
+    """
+    rows = sorted(set(rows))
+    inserted = 0
+    with dictionary_connection() as dictionary, dictionary.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(_format_sql(INSERT_SQL, dictionary, model, fields, len(batch)),
+                           [value for row in batch for value in row])
+            inserted += cursor.rowcount
+    return inserted
+
+
+@contextmanager
+def dictionary_connection():
+    """
+    Соединение для пополнения справочников: в PostgreSQL - отдельное, закрывается при выходе, в остальных БД - текущее
+    """
+    if connection.vendor != 'postgresql':
+        yield connection
+        return
+
+    dictionary = connections.create_connection(connection.alias)
+    try:
+        dictionary.set_autocommit(True)
+        yield dictionary
+    finally:
+        dictionary.close()
+
+
+def _select_batch(model, fields, rows, ids):
+    """
+    Поиск ИД строк пачки в текущей транзакции: найденные ИД добавляются в ids
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(_format_sql(SELECT_SQL, connection, model, fields, len(rows)),
+                       [value for row in rows for value in row])
+        for row_id, *row in cursor.fetchall():
+            ids[tuple(row)] = row_id
+
+
+def _format_sql(sql, db, model, fields, count):
+    """
+    Подстановка таблицы, колонок fields и count строк значений в запрос
+    """
+    quote_name = db.ops.quote_name
+    table = quote_name(model._meta.db_table)
+    columns = [quote_name(model._meta.get_field(field).column) for field in fields]
+    placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    return sql.format(
+        table=table,
+        columns=', '.join(columns),
+        values=', '.join([placeholders] * count),
+        table_columns=', '.join(f'{table}.{column}' for column in columns),
+        join=' AND '.join(f'{table}.{column} = new_rows.{column}' for column in columns),
+    )
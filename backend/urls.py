@@ -3,7 +3,9 @@ from django_rest_passwordreset.views import reset_password_request_token, reset_
 
 from backend.views import PartnerUpdate, RegisterAccount, LoginAccount, CategoryView, ShopView, ProductInfoView, \
     BasketView, PartnerOrderStatus, PartnerOrderItemQuantity, \
-    AccountDetails, ContactView, OrderView, PartnerState, PartnerOrders, ConfirmAccount, PartnerExport
+    AccountDetails, ContactView, OrderView, PartnerState, PartnerOrders, ConfirmAccount, PartnerExport, \
+    PartnerUpdateStatus, PartnerStock, PartnerUpdateHistory, PartnerCatalogVersions, \
+    PartnerExportStatus, PartnerExportDownload, ProductFacetsView, ProductSuggestView
 
 
 
@@ -11,7 +13,13 @@ from backend.views import PartnerUpdate, RegisterAccount, LoginAccount, Category
 app_name = 'backend'
 urlpatterns = [
     path('partner/update', PartnerUpdate.as_view(), name='partner-update'),
+    path('partner/update/status', PartnerUpdateStatus.as_view(), name='partner-update-status'),
+    path('partner/update/history', PartnerUpdateHistory.as_view(), name='partner-update-history'),
+    path('partner/stock', PartnerStock.as_view(), name='partner-stock'),
+    path('partner/catalog/versions', PartnerCatalogVersions.as_view(), name='partner-catalog-versions'),
     path('partner/export', PartnerExport.as_view(), name='partner-export'),
+    path('partner/export/status', PartnerExportStatus.as_view(), name='partner-export-status'),
+    path('partner/export/download', PartnerExportDownload.as_view(), name='partner-export-download'),
     path('partner/state', PartnerState.as_view(), name='partner-state'),
     path('partner/orders', PartnerOrders.as_view(), name='partner-orders'),
     path('partner/orders/status', PartnerOrderStatus.as_view(), name='partner-orders-status'),
@@ -26,6 +34,8 @@ urlpatterns = [
     path('categories', CategoryView.as_view(), name='categories'),
     path('shops', ShopView.as_view(), name='shops'),
     path('products', ProductInfoView.as_view(), name='shops'),
+    path('products/facets', ProductFacetsView.as_view(), name='product-facets'),
+    path('products/suggest', ProductSuggestView.as_view(), name='product-suggest'),
     path('basket', BasketView.as_view(), name='basket'),
     path('order', OrderView.as_view(), name='order'),
    
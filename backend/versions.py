@@ -0,0 +1,86 @@
+import gzip
+import json
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import File
+from django.db import transaction
+from django.db.models import Max
+
+from backend.models import Shop, ProductInfo, CatalogVersion
+
+
+# Предложений в одной выборке при снятии снимка
+SNAPSHOT_CHUNK_SIZE = 2000
+
+
+def write_snapshot(shop, file):
+    """
+    Запись каталога магазина в gzip NDJSON в формате прайс-листа: заголовок с магазином и категориями,
+    затем по предложению на строку. Возвращает число предложений
+    """
+    count = 0
+    with gzip.GzipFile(fileobj=file, mode='wb') as archive:
+        header = {
+            'shop': shop.name,
+            'categories': [{'id': category.id, 'name': category.name}
+                           for category in shop.categories.order_by('id')],
+        }
+        archive.write((json.dumps(header, ensure_ascii=False) + '\n').encode('utf-8'))
+
+        offers = ProductInfo.objects.filter(shop_id=shop.id).select_related('product').prefetch_related(
+            'product_parameters__parameter').order_by('id')
+        for offer in offers.iterator(chunk_size=SNAPSHOT_CHUNK_SIZE):
+            item = {
+                'id': offer.external_id,
+                'category': offer.product.category_id,
+                'model': offer.model,
+                'name': offer.product.name,
+                'price': str(offer.price),
+                'price_rrc': str(offer.price_rrc),
+                'quantity': offer.quantity,
+                'parameters': {parameter.parameter.name: parameter.value
+                               for parameter in offer.product_parameters.all()},
+            }
+            archive.write((json.dumps(item, ensure_ascii=False) + '\n').encode('utf-8'))
+            count += 1
+    return count
+
+
+def create_catalog_version(shop, job=None):
+    """
+    Снимок текущего каталога магазина как новая версия, она же становится текущей.
+    Если хранение версий отключено (CATALOG_VERSIONS_KEEP = 0), снимок не создается
+    """
+    if not settings.CATALOG_VERSIONS_KEEP:
+        return None
+
+    number = (CatalogVersion.objects.filter(shop=shop).aggregate(number=Max('number'))['number'] or 0) + 1
+    version = CatalogVersion(shop=shop, job=job, number=number)
+    with File(tempfile.TemporaryFile()) as file:
+        version.goods = write_snapshot(shop, file)
+        file.seek(0)
+        version.file.save(f'shop{shop.id}-v{number}.ndjson.gz', file, save=False)
+    with transaction.atomic():
+        version.save()
+        Shop.objects.filter(id=shop.id).update(catalog_version=version)
+    return version
+
+
+def collect_catalog_versions(keep=None):
+    """
+    Удаление старых версий каталогов: у каждого магазина остаются keep последних и текущая.
+    Возвращает число удаленных версий
+    """
+    keep = settings.CATALOG_VERSIONS_KEEP if keep is None else keep
+    deleted = 0
+    for shop in Shop.objects.filter(catalog_versions__isnull=False).distinct():
+        recent = CatalogVersion.objects.filter(shop=shop).order_by('-number').values_list('id', flat=True)[:keep]
+        stale = CatalogVersion.objects.filter(shop=shop).exclude(id__in=list(recent))
+        if shop.catalog_version_id:
+            stale = stale.exclude(id=shop.catalog_version_id)
+        for version in stale:
+            version.file.delete(save=False)
+            version.delete()
+            deleted += 1
+    return deleted
@@ -1,6 +1,9 @@
 
+import os
+
 import yaml
 from datetime import timedelta
+from decimal import Decimal, InvalidOperation
 
 
 from django.conf import settings
@@ -12,18 +15,24 @@ from django.core.mail import send_mail
 from django.db import transaction
 from django.db.models import Q, Sum, F
 from django.dispatch import receiver
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
 
 from rest_framework.authtoken.models import Token
 from rest_framework.generics import ListAPIView
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, PageNumberPagination
+from rest_framework.parsers import JSONParser
 
 
+from celery.result import AsyncResult
 from requests import get
 from yaml import load as load_yaml, Loader
 from setuptools._distutils.util import strtobool
@@ -33,15 +42,30 @@ from backend.models import (
     User, USER_TYPE_CHOICES,
     Shop, Category, Product, ProductInfo, 
     Parameter, ProductParameter, Order, OrderItem,
-    Contact, ConfirmEmailToken
+    Contact, ConfirmEmailToken, ImportJob, CatalogVersion, ExportJob, CatalogEntry
 )
 from backend.serializers import (
     UserSerializer, CategorySerializer, ShopSerializer, 
     ProductInfoSerializer, OrderItemSerializer, OrderSerializer,
     ContactSerializer, PartnerOrderItemUpdateSerializer,
-    PartnerOrderStatusSerializer
+    PartnerOrderStatusSerializer, ImportJobSerializer, CatalogVersionSerializer, ExportJobSerializer,
+    CatalogEntrySerializer
 )
 from backend.signals import new_order, order_status_changed, order_item_quantity_changed
+from backend.importer import IMPORT_MODES, MODE_DIFF
+from backend.tasks import import_price_list_task, export_price_list_task, refresh_facets_task
+from backend.parsers import NDJSONParser
+from backend.stock import apply_stock_updates
+from backend.scheduler import find_pending_job
+from backend.catalog import update_catalog_shop_state
+from backend.facets import category_facets, filter_by_parameters, parse_parameter_filters
+from backend.search import search_products
+from backend.suggest import suggest
+from backend.exports import (
+    DEFAULT_EXPORT_FORMAT, EXPORT_FORMATS, EXPORT_COMPRESSIONS,
+    cache_export, encode_export, export_cache_path, export_etag, export_name, find_export_job, get_export_state,
+    iter_file_range, parse_range,
+)
 
 
 class PartnerUpdate(APIView):
@@ -51,7 +75,9 @@ class PartnerUpdate(APIView):
 
     def post(self, request, *args, **kwargs):
         """
-        Импорт прайс-листа поставщика из YAML файла по URL
+        Постановка импорта прайс-листа поставщика по URL или из загруженного файла в очередь Celery.
+        Формат (YAML, JSON, NDJSON или CSV) определяется по Content-Type ответа или расширению файла.
+        Возвращает ИД задачи импорта, статус которой доступен в partner/update/status
         """
         # Аутентинтификация
         if not request.user.is_authenticated:
@@ -61,70 +87,158 @@ class PartnerUpdate(APIView):
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
         url = request.data.get('url')
+        # Прайс-лист можно загрузить файлом (multipart, поле file) вместо ссылки
+        upload = request.FILES.get('file')
         # Валидация URL
-        if url:
+        if url and not upload:
             validate_url = URLValidator()
             try:
                 validate_url(url)
             except ValidationError as e:
                 return JsonResponse({'Status': False, 'Error': str(e)})
-            else:
-                # Загрузка YAML
 
-                try:
-                    stream = get(url, timeout=20).content
-                    data = load_yaml(stream, Loader=Loader)
-                except Exception as e:
-                    return JsonResponse({'Status': False, 'Error': f'Ошибка загрузки файла: {str(e)}'})
-                
-                required_fields = ['shop', 'categories', 'goods']
-                for field in required_fields:
-                    if field not in data:
-                        return JsonResponse({
-                            'Status': False, 
-                            'Error': f'Отсутствует обязательное поле: {field}'
-                        }, status=400)
-                # stream = get(url).content
-                # data = load_yaml(stream, Loader=Loader)
-
-                # Импорт магазина
-                shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=request.user.id)
-                # Импорт категорий магазина
-                for category in data['categories']:
-                    category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-                    category_object.shops.add(shop.id)
-                    category_object.save()
-                #Удаляем все предыдущие предложения товаров этого магазина перед новым импортом
-                ProductInfo.objects.filter(shop_id=shop.id).delete()
-                # Импорт товаров
-                for item in data['goods']:
-                    product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-
-                    product_info = ProductInfo.objects.create(product_id=product.id,
-                                                              external_id=item['id'],
-                                                              model=item['model'],
-                                                              price=item['price'],
-                                                              price_rrc=item['price_rrc'],
-                                                              quantity=item['quantity'],
-                                                              shop_id=shop.id)
-                    # Обработка параметров товаров
-                    for name, value in item['parameters'].items():
-                        parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                        ProductParameter.objects.create(product_info_id=product_info.id,
-                                                        parameter_id=parameter_object.id,
-                                                        value=value)
+        if url or upload:
+            # Режим импорта: diff (по умолчанию) - сравнение с текущим каталогом,
+            # replace - удаление всех предложений магазина и загрузка заново
+            mode = request.data.get('mode', MODE_DIFF)
+            if mode not in IMPORT_MODES:
+                return JsonResponse({
+                    'Status': False,
+                    'Error': f'Недопустимый режим импорта. Допустимо: {", ".join(IMPORT_MODES)}'
+                }, status=400)
 
-                return JsonResponse({'Status': True})
+            # force - импорт даже если прайс-лист не изменился с прошлой загрузки
+            force = request.data.get('force', False)
+            if isinstance(force, str):
+                try:
+                    force = bool(strtobool(force))
+                except ValueError as error:
+                    return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+
+            # refresh_interval - интервал автообновления прайс-листа в минутах, 0 - отключить
+            refresh_interval = request.data.get('refresh_interval')
+            if refresh_interval is not None:
+                if upload:
+                    return JsonResponse({
+                        'Status': False,
+                        'Errors': 'Автообновление доступно только для прайс-листа по ссылке'
+                    }, status=400)
+                if not str(refresh_interval).isdigit():
+                    return JsonResponse({
+                        'Status': False,
+                        'Errors': 'refresh_interval должен быть целым неотрицательным числом минут'
+                    }, status=400)
+                refresh_interval = int(refresh_interval)
+
+            # Повторный запрос того же прайс-листа присоединяется к задаче, которая еще ждет в очереди.
+            # Остальные выполняются по очереди после текущего импорта магазина
+            if not upload:
+                pending = find_pending_job(request.user.id, url, mode, force, refresh_interval)
+                if pending:
+                    return JsonResponse({'Status': True, 'Job': pending.id, 'State': pending.state, 'Coalesced': True},
+                                        status=202)
+
+            # Загрузка и импорт выполняются в фоне через Celery.
+            # Загруженный файл уже лежит во временном файле на диске и переносится в MEDIA_ROOT без чтения в память
+            job = ImportJob.objects.create(user_id=request.user.id, url='' if upload else url, file=upload,
+                                           mode=mode, force=force, refresh_interval=refresh_interval)
+            result = import_price_list_task.delay(job.id)
+            ImportJob.objects.filter(id=job.id).update(task_id=result.id)
+
+            return JsonResponse({'Status': True, 'Job': job.id, 'State': job.state}, status=202)
 
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
+class PartnerUpdateStatus(APIView):
+    """
+    Класс для получения статуса импорта прайс-листа
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Статус задачи импорта по ИД (параметр job) или последней задачи пользователя
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        jobs = ImportJob.objects.filter(user_id=request.user.id)
+        job_id = request.query_params.get('job')
+        if job_id:
+            if not job_id.isdigit():
+                return JsonResponse({'Status': False, 'Errors': 'Некорректный ИД задачи'}, status=400)
+            jobs = jobs.filter(id=job_id)
+
+        job = jobs.first()
+        if not job:
+            return JsonResponse({'Status': False, 'Error': 'Задача импорта не найдена'}, status=404)
+
+        data = ImportJobSerializer(job).data
+        # Пока импорт идет, прогресс берем из состояния задачи Celery
+        if job.state == 'running' and job.task_id:
+            info = AsyncResult(job.task_id).info
+            if isinstance(info, dict):
+                data['processed'] = info.get('processed', job.processed)
+        return Response(data)
+
+
+class PartnerStock(APIView):
+    """
+    Класс для быстрого обновления остатков и цен поставщика
+    """
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Обновление остатков и цен предложений магазина без полного импорта прайс-листа.
+        Принимает список записей external_id, quantity, price, price_rrc в JSON
+        (список или {"items": [...]}) или NDJSON (application/x-ndjson).
+        Необязательные поля, которых нет в записи, не меняются
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        shop = Shop.objects.filter(user_id=request.user.id).first()
+        if not shop:
+            return JsonResponse({'Status': False, 'Error': 'Магазин не найден'}, status=404)
+
+        records = request.data
+        if isinstance(records, dict):
+            records = records.get('items')
+        if records is None or isinstance(records, (str, dict)):
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'}, status=400)
+
+        result = apply_stock_updates(shop.id, records)
+        return JsonResponse({
+            'Status': not result['errors'],
+            'Обновлено объектов': result['updated'],
+            'Не найдено': result['not_found'],
+            'Errors': result['errors'],
+        })
+
+
 class PartnerExport(APIView):
     """
     Класс для экспорта прайс-листа магазина
     """
+    def perform_content_negotiation(self, request, force=False):
+        # Параметр format выбирает формат выгрузки, а не рендерер DRF
+        return super().perform_content_negotiation(request, force=True)
+
     def get(self, request, *args, **kwargs):
-        pass
+        """
+        Выгрузка прайс-листа. Формат - параметр format (yaml, json, ndjson, csv) или заголовок Accept,
+        по умолчанию YAML; compression=gzip или zstd (если установлен пакет zstandard) сжимает выгрузку потоком.
+        Выгрузка кэшируется по ревизии каталога, которая растет при каждом импорте и обновлении
+        остатков. ETag - ревизия, формат и сжатие: при совпадении If-None-Match ответ 304
+        без обращения к каталогу, неизмененная выгрузка отдается из файла
+        """
         # Аутентинтификация
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
@@ -132,68 +246,61 @@ class PartnerExport(APIView):
         if request.user.type != 'shop':
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
+        format = request.query_params.get('format')
+        if not format:
+            preferred = request.get_preferred_type([feed['content_type'].split(';')[0]
+                                                    for feed in EXPORT_FORMATS.values()])
+            format = next((name for name, feed in EXPORT_FORMATS.items()
+                           if feed['content_type'].split(';')[0] == preferred), DEFAULT_EXPORT_FORMAT)
+        if format not in EXPORT_FORMATS:
+            return JsonResponse({'Status': False, 'Error': f'Неизвестный формат выгрузки: {format}. '
+                                                           f'Доступны: {", ".join(EXPORT_FORMATS)}'}, status=400)
+        compression = request.query_params.get('compression') or None
+        if compression and compression not in EXPORT_COMPRESSIONS:
+            return JsonResponse({'Status': False, 'Error': f'Неизвестное сжатие: {compression}. '
+                                                           f'Доступны: {", ".join(EXPORT_COMPRESSIONS)}'}, status=400)
+
+        # async=1 - выгрузка в файл фоновой задачей, статус в partner/export/status
+        try:
+            run_async = bool(strtobool(request.query_params.get('async', '0')))
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+        if run_async:
+            return self.start_job(request, format, compression)
+
         try:
             # Проверка если еще не создан магазин (не было импорта)
-            shop = Shop.objects.filter(user_id=request.user.id).first()
-            if not shop:
+            state = get_export_state(request.user.id)
+            if not state:
                 return JsonResponse({'Status': False, 'Error': 'Магазин не найден'}, status=404)
-            
-            # Собираем данные в структуру для YAML
-            export_data = {
-                'shop': shop.name,
-                'categories': [],
-                'goods': []
-            }
-            
-            # Собираем категории
-            categories = Category.objects.filter(shops=shop).distinct()
-            for category in categories:
-                export_data['categories'].append({
-                    'id': category.id,
-                    'name': category.name
-                })
-            
-            # Собираем товары
-            products = ProductInfo.objects.filter(
-                shop=shop
-            ).select_related('product', 'product__category').prefetch_related('product_parameters__parameter')
-            
-            for product in products:
-                product_data = {
-                    'id': product.external_id,                    
-                    'category': product.product.category_id,
-                    'model': product.model,
-                    'name': product.product.name,
-                    'price': float(product.price) if product.price is not None else None,
-                    'price_rrc': float(product.price_rrc) if product.price is not None else None,
-                    'quantity': product.quantity,
-                    'parameters': {}
-                }
-                
-                # Добавляем параметры товара
-                for param in product.product_parameters.all():
-                    product_data['parameters'][param.parameter.name] = param.value
-                
-                export_data['goods'].append(product_data)
-            
-            # Формируем YAML
-            yaml_data = yaml.dump(
-                export_data,
-                allow_unicode=True,  
-                default_flow_style=False,  
-                sort_keys=False  
-            )
 
-            # вставляем пустую строку
-            if '\ngoods:' in yaml_data:
-                goods_index = yaml_data.find('\ngoods:')
-                yaml_data = yaml_data[:goods_index] + '\n' + yaml_data[goods_index:]
-
-            # Создаем HTTP-ответ с YAML файлом
-            response = HttpResponse(yaml_data, content_type='application/x-yaml')
-            response['Content-Disposition'] = f'attachment; filename="{shop.name}_export_{timezone.now().date()}.yaml"'
+            name = export_name(state, format, compression)
+            etag = export_etag(name)
+            if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+            if etag in if_none_match or '*' in if_none_match:
+                response = HttpResponse(status=304)
+            else:
+                content_type = EXPORT_COMPRESSIONS[compression]['content_type'] if compression \
+                    else EXPORT_FORMATS[format]['content_type']
+                path = export_cache_path(name)
+                try:
+                    response = FileResponse(open(path, 'rb'), content_type=content_type)
+                except FileNotFoundError:
+                    shop = Shop.objects.filter(id=state['id']).first()
+                    if not shop:
+                        return JsonResponse({'Status': False, 'Error': 'Магазин не найден'}, status=404)
+                    # Выгрузка отдается по частям по мере выборки товаров и заодно пишется в кэш
+                    chunks = encode_export(EXPORT_FORMATS[format]['writer'](shop), compression)
+                    response = StreamingHttpResponse(cache_export(chunks, path), content_type=content_type)
+                extension = name.split('.', 1)[1]
+                response['Content-Disposition'] = \
+                    f'attachment; filename="{state["name"]}_export_{timezone.now().date()}.{extension}"'
+
+            response['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Accept'])
             return response
-            
+
         except Exception as e:
             return JsonResponse({
                 'Status': False, 
@@ -201,6 +308,127 @@ class PartnerExport(APIView):
             }, status=500)
 
 
+    @staticmethod
+    def start_job(request, format, compression):
+        """
+        Постановка фоновой выгрузки в очередь. Если такая же выгрузка уже ждет, выполняется
+        или готова по текущей ревизии каталога, возвращается она
+        """
+        state = get_export_state(request.user.id)
+        if not state:
+            return JsonResponse({'Status': False, 'Error': 'Магазин не найден'}, status=404)
+
+        job = find_export_job(request.user.id, state, format, compression)
+        if job:
+            return JsonResponse({'Status': True, 'Job': job.id, 'State': job.state, 'Coalesced': True}, status=202)
+
+        job = ExportJob.objects.create(user_id=request.user.id, shop_id=state['id'], format=format,
+                                       compression=compression or '', catalog_revision=state['catalog_revision'])
+        result = export_price_list_task.delay(job.id)
+        ExportJob.objects.filter(id=job.id).update(task_id=result.id)
+        job.refresh_from_db(fields=['state'])
+        return JsonResponse({'Status': True, 'Job': job.id, 'State': job.state}, status=202)
+
+
+class PartnerExportStatus(APIView):
+    """
+    Класс для получения статуса фоновой выгрузки прайс-листа
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Статус задачи выгрузки по ИД (параметр job) или последней задачи пользователя.
+        У готовой выгрузки - ссылка на скачивание
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        jobs = ExportJob.objects.filter(user_id=request.user.id)
+        job_id = request.query_params.get('job')
+        if job_id:
+            if not job_id.isdigit():
+                return JsonResponse({'Status': False, 'Errors': 'Некорректный ИД задачи'}, status=400)
+            jobs = jobs.filter(id=job_id)
+
+        job = jobs.first()
+        if not job:
+            return JsonResponse({'Status': False, 'Error': 'Задача выгрузки не найдена'}, status=404)
+
+        data = ExportJobSerializer(job).data
+        if job.state == 'done':
+            data['download'] = request.build_absolute_uri(
+                f'{reverse("backend:partner-export-download")}?job={job.id}')
+        return Response(data)
+
+
+class PartnerExportDownload(APIView):
+    """
+    Класс для скачивания файла фоновой выгрузки прайс-листа
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Файл готовой выгрузки (параметр job). Поддерживается заголовок Range с одним диапазоном
+        байтов, поэтому прерванное скачивание можно продолжить; If-Range с ETag файла
+        защищает от склейки частей разных файлов
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        job_id = request.query_params.get('job')
+        if not job_id or not job_id.isdigit():
+            return JsonResponse({'Status': False, 'Errors': 'Не указан ИД задачи'}, status=400)
+
+        job = ExportJob.objects.filter(user_id=request.user.id, id=job_id).select_related('shop').first()
+        if not job:
+            return JsonResponse({'Status': False, 'Error': 'Задача выгрузки не найдена'}, status=404)
+        if job.state != 'done' or not job.file:
+            return JsonResponse({'Status': False, 'Error': 'Выгрузка еще не готова', 'State': job.state},
+                                status=409)
+        try:
+            file = job.file.open('rb')
+        except FileNotFoundError:
+            return JsonResponse({'Status': False, 'Error': 'Срок хранения выгрузки истек'}, status=410)
+
+        size = job.size
+        etag = f'"export{job.id}-{size}"'
+        compression = job.compression or None
+        content_type = EXPORT_COMPRESSIONS[compression]['content_type'] if compression \
+            else EXPORT_FORMATS[job.format]['content_type']
+
+        # Range учитывается, только если файл не изменился с прошлой части (If-Range)
+        if_range = request.headers.get('If-Range')
+        header = request.headers.get('Range') if not if_range or if_range == etag else None
+        try:
+            byte_range = parse_range(header, size)
+        except ValueError:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(iter_file_range(file, start, end), status=206,
+                                             content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            response = FileResponse(file, content_type=content_type)
+        extension = os.path.basename(job.file.name).split('.', 1)[1]
+        response['Content-Disposition'] = \
+            f'attachment; filename="{job.shop.name}_export_{job.created_at.date()}.{extension}"'
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        return response
+
+
 class RegisterAccount(APIView):
     """
     Класс для регистрации пользователей
@@ -451,6 +679,83 @@ class StandardPagination(PageNumberPagination):
     max_page_size = 100
 
 
+class ProductCursorPagination(CursorPagination):
+    """
+    Постраничный вывод товаров по ключу: следующая страница выбирается условием по ИД последнего
+    товара, а не OFFSET, поэтому дальние страницы не дороже первой. Курсоры next/previous непрозрачны
+    """
+    ordering = 'pk'
+    page_size = 40
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class ProductSearchPagination(ProductCursorPagination):
+    """
+    Постраничный вывод результатов поиска по убыванию релевантности, при равной релевантности - по ИД.
+    CursorPagination сравнивает только первое поле сортировки и среди товаров с равной релевантностью
+    листает через OFFSET, поэтому курсор здесь хранит пару (релевантность, ИД) крайнего товара страницы,
+    и соседняя страница выбирается составным условием по этой паре
+    """
+    ordering = ('-rank', 'pk')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        position = self.decode_position(self.cursor.position) if self.cursor else None
+        reverse = bool(self.cursor and self.cursor.reverse)
+
+        if position is not None:
+            rank, pk = position
+            # Вперед - товары с меньшей релевантностью или с той же и большим ИД, назад - наоборот
+            if reverse:
+                queryset = queryset.filter(Q(rank__gt=rank) | Q(rank=rank, pk__lt=pk))
+            else:
+                queryset = queryset.filter(Q(rank__lt=rank) | Q(rank=rank, pk__gt=pk))
+        queryset = queryset.order_by(*(('rank', '-pk') if reverse else self.ordering))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_following
+        else:
+            self.has_next, self.has_previous = has_following, position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.encode_position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.encode_position(self.page[0])))
+
+    @staticmethod
+    def encode_position(instance):
+        return f'{instance.rank!r}:{instance.pk}'
+
+    def decode_position(self, position):
+        """
+        Пара (релевантность, ИД) из курсора
+        """
+        try:
+            rank, pk = position.split(':')
+            return float(rank), int(pk)
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+
 class CategoryView(ListAPIView):
     """
     Класс для просмотра категорий
@@ -469,35 +774,172 @@ class ShopView(ListAPIView):
     pagination_class = StandardPagination 
 
 
-class ProductInfoView(APIView):
+class PartnerCatalogVersions(ListAPIView):
+    """
+    Класс для просмотра сохраненных версий каталога магазина
+    """
+    serializer_class = CatalogVersionSerializer
+    pagination_class = StandardPagination
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return CatalogVersion.objects.filter(shop__user_id=self.request.user.id).select_related('shop')
+
+    def post(self, request, *args, **kwargs):
+        """
+        Откат каталога магазина к сохраненной версии (параметр version - номер версии).
+        Откат ставится в общую очередь импорта магазина и применяется как импорт снимка в режиме diff
+        """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        number = request.data.get('version')
+        if number is None:
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'}, status=400)
+        if not str(number).isdigit():
+            return JsonResponse({'Status': False, 'Errors': 'Некорректный номер версии'}, status=400)
+
+        version = CatalogVersion.objects.filter(shop__user_id=request.user.id, number=number).first()
+        if not version:
+            return JsonResponse({'Status': False, 'Error': 'Версия каталога не найдена'}, status=404)
+
+        job = ImportJob.objects.create(user_id=request.user.id, shop_id=version.shop_id, mode=MODE_DIFF,
+                                       force=True, source='rollback', rollback_to=version,
+                                       rollback_version=version.number)
+        result = import_price_list_task.delay(job.id)
+        ImportJob.objects.filter(id=job.id).update(task_id=result.id)
+
+        return JsonResponse({'Status': True, 'Job': job.id, 'State': job.state}, status=202)
+
+
+class PartnerUpdateHistory(ListAPIView):
+    """
+    Класс для просмотра истории импорта прайс-листов магазина: время, запросы, строки и память по этапам.
+    Фильтры: state, source, mode
+    """
+    serializer_class = ImportJobSerializer
+    pagination_class = StandardPagination
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = ImportJob.objects.filter(user_id=self.request.user.id)
+        for field in ('state', 'source', 'mode'):
+            value = self.request.query_params.get(field)
+            if value:
+                queryset = queryset.filter(**{field: value})
+        return queryset
+
+
+class ProductInfoView(ListAPIView):
     """
     Класс для поиска и фильтрации товаров
     """
-    pagination_class = StandardPagination 
-    def get(self, request: Request, *args, **kwargs):
+    serializer_class = CatalogEntrySerializer
+    pagination_class = ProductCursorPagination
+
+    def get(self, request, *args, **kwargs):
         """
-        Поиск товаров с фильтрацией по  параметрам
+        Фильтры: shop_id, category_id, price_min, price_max, in_stock и параметры товаров - param[Имя]=значение
+        (параметр можно повторить для нескольких значений) или param[Имя]__gte=число, а также __lte, __gt, __lt.
+        Поиск: q - слова названия, модели или значений параметров, результаты по убыванию релевантности
         """
-        query = Q(shop__state=True)
-        shop_id = request.query_params.get('shop_id')
-        category_id = request.query_params.get('category_id')
+        self.catalog_filters = {}
+        try:
+            self.parameter_filters = parse_parameter_filters(request.query_params)
+            for name, lookup in (('price_min', 'price__gte'), ('price_max', 'price__lte')):
+                if request.query_params.get(name):
+                    self.catalog_filters[lookup] = Decimal(request.query_params[name])
+            if request.query_params.get('in_stock'):
+                self.catalog_filters['in_stock'] = bool(strtobool(request.query_params['in_stock']))
+        except InvalidOperation:
+            return JsonResponse({'Status': False, 'Errors': 'Некорректная цена'}, status=400)
+        except ValueError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)}, status=400)
+
+        self.search = request.query_params.get('q', '').strip()
+        if self.search:
+            self.pagination_class = ProductSearchPagination
+
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        """
+        Поиск товаров с фильтрацией по  параметрам.
+        Товары отдаются из каталога для выдачи: готовые документы без соединения с продуктами и параметрами
+        """
+        query = Q(shop_state=True, **self.catalog_filters)
+        shop_id = self.request.query_params.get('shop_id')
+        category_id = self.request.query_params.get('category_id')
 
         if shop_id:
             query = query & Q(shop_id=shop_id)
 
         if category_id:
-            query = query & Q(product__category_id=category_id)
+            query = query & Q(category_id=category_id)
 
-        # фильтруем и отбрасываем дуликаты
-        queryset = ProductInfo.objects.filter(
-            query).select_related(
-            'shop', 'product__category').prefetch_related(
-            'product_parameters__parameter').distinct()
+        # Фильтры только по колонкам каталога и EXISTS, дубликатов нет, DISTINCT не нужен
+        queryset = CatalogEntry.objects.filter(query).only('document')
+        if self.search:
+            queryset = search_products(queryset, self.search, vector='product_info__search_vector')
+        return filter_by_parameters(queryset, self.parameter_filters, category_id)
 
-        serializer = ProductInfoSerializer(queryset, many=True)
 
-        return Response(serializer.data)
-    
+class ProductFacetsView(APIView):
+    """
+    Класс для получения фасетов категории
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Значения параметров товаров категории (category_id) с числом предложений открытых магазинов.
+        Считаются заранее при импорте, запрос читает только готовые счетчики
+        """
+        category_id = request.query_params.get('category_id')
+        if not category_id or not category_id.isdigit():
+            return JsonResponse({'Status': False, 'Errors': 'Не указана категория'}, status=400)
+
+        return Response({'category_id': int(category_id), 'facets': category_facets(category_id)})
+
+
+class ProductSuggestView(APIView):
+    """
+    Класс для подсказок при вводе поискового запроса
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Названия товаров и модели, похожие на q (часть слова или слово с опечаткой), не больше limit каждых
+        """
+        limit = request.query_params.get('limit', str(settings.SUGGEST_LIMIT))
+        if not limit.isdigit() or not 0 < int(limit) <= settings.SUGGEST_MAX_LIMIT:
+            return JsonResponse({'Status': False,
+                                 'Errors': f'limit должен быть от 1 до {settings.SUGGEST_MAX_LIMIT}'}, status=400)
+
+        query = request.query_params.get('q', '')
+        response = Response({'query': query, **suggest(query, int(limit))})
+        # Подсказки запрашиваются на каждое нажатие клавиши: повтор запроса браузер берет из своего кэша
+        patch_cache_control(response, public=True, max_age=settings.SUGGEST_CACHE_TTL)
+        return response
+
 
 class BasketView(APIView):
     """
@@ -803,7 +1245,13 @@ class PartnerState(APIView):
         state = request.data.get('state')
         if state:
             try:
-                Shop.objects.filter(user_id=request.user.id).update(state=strtobool(state))
+                with transaction.atomic():
+                    Shop.objects.filter(user_id=request.user.id).update(state=strtobool(state))
+                    update_catalog_shop_state(Shop.objects.filter(user_id=request.user.id))
+                # В фасетах учитываются только предложения открытых магазинов
+                category_ids = list(Category.objects.filter(shops__user_id=request.user.id).values_list('id', flat=True))
+                if category_ids:
+                    refresh_facets_task.delay(category_ids)
                 return JsonResponse({'Status': True})
             except ValueError as error:
                 return JsonResponse({'Status': False, 'Errors': str(error)}, status = 400)
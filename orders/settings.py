@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'rest_framework.authtoken',
@@ -128,6 +129,15 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Загруженные прайс-листы хранятся до окончания импорта
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Готовые выгрузки прайс-листов магазинов, по файлу на ревизию каталога
+EXPORT_CACHE_DIR = MEDIA_ROOT / 'exports'
+
+# Загружаемые файлы сразу пишутся во временный файл на диске, без копии в памяти
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -168,6 +178,47 @@ REST_FRAMEWORK = {
 }
 
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL', 'redis://redis:6379/1'),
+    },
+}
+EXPORT_STATE_CACHE_TIMEOUT = 5 * 60  # магазин и ревизия каталога для выгрузки в кэше, секунд
+EXPORT_JOB_TTL = int(os.getenv('EXPORT_JOB_TTL', 24 * 60 * 60))  # срок хранения файла фоновой выгрузки, секунд
+
 CELERY_BROKER_URL = 'redis://redis:6379/0'
 CELERY_RESULT_BACKEND = 'redis://redis:6379/0'
 CELERY_TIMEZONE = 'Europe/Moscow'
+CELERY_BEAT_SCHEDULE = {
+    'refresh-shop-feeds': {
+        'task': 'backend.tasks.schedule_feed_refresh_task',
+        'schedule': 60.0,
+    },
+    'collect-catalog-versions': {
+        'task': 'backend.tasks.collect_catalog_versions_task',
+        'schedule': 60.0 * 60,
+    },
+    'collect-export-jobs': {
+        'task': 'backend.tasks.collect_export_jobs_task',
+        'schedule': 60.0 * 60,
+    },
+}
+
+# Автообновление прайс-листов магазинов
+FEED_REFRESH_CONCURRENCY = int(os.getenv('FEED_REFRESH_CONCURRENCY', 4))  # одновременных импортов
+FEED_REFRESH_JITTER = 0.1  # случайная добавка к интервалу, доля интервала
+FEED_REFRESH_START_JITTER = 30  # случайная задержка старта импорта, секунд
+IMPORT_JOB_TIMEOUT = 60 * 60  # после этого незавершенная задача импорта считается зависшей, секунд
+IMPORT_TRACE_MEMORY = os.getenv('IMPORT_TRACE_MEMORY', 'True') == 'True'  # пик памяти импорта через tracemalloc
+FEED_ARCHIVE_WORKERS = int(os.getenv('FEED_ARCHIVE_WORKERS', 0))  # процессов разбора zip-архива, 0 - по числу ядер
+IMPORT_QUEUE_RETRY_DELAY = 10  # повторная попытка запуска импорта, если идет другой импорт магазина, секунд
+
+# Версии каталогов магазинов: сколько последних снимков хранить для отката, 0 - не сохранять
+CATALOG_VERSIONS_KEEP = int(os.getenv('CATALOG_VERSIONS_KEEP', 5))
+
+# Подсказки при вводе поискового запроса (products/suggest)
+SUGGEST_LIMIT = 10  # подсказок по умолчанию, не больше SUGGEST_MAX_LIMIT
+SUGGEST_MAX_LIMIT = 20
+SUGGEST_CACHE_SIZE = int(os.getenv('SUGGEST_CACHE_SIZE', 4096))  # запросов в LRU-кэше процесса
+SUGGEST_CACHE_TTL = 60  # время жизни подсказок в кэше процесса, секунд